@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基于NumPy数组的网格画布
+矩阵拼接时所有图片尺寸相同，整张画布可以看作 (行, 列, 高, 宽, 通道) 的跨步视图，
+每个格子就是一次切片赋值；背景和间隔在分配时一次性填充。
+底层数组可以是内存中的数组，也可以是磁盘上的内存映射文件。
+NumPy 为可选依赖，未安装时 HAS_NUMPY 为False，调用方应回退到 PIL 的 paste
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+from strip_writer import PngStripWriter
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import as_strided
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# 支持的画布模式 -> 通道数
+MODE_CHANNELS = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+# 画布超过该字节数时改用磁盘上的内存映射文件，默认1GB
+DEFAULT_MMAP_THRESHOLD = 1 << 30
+# 从内存映射画布编码时每个条带的行数
+BAND_ROWS = 256
+
+
+def canvas_bytes(width, height, mode='RGB'):
+    # 画布未压缩时占用的字节数
+    return width * height * MODE_CHANNELS.get(mode, 4)
+
+
+def grid_size(rows, cols, width, height, gap):
+    # 网格画布的整体尺寸 (宽, 高)
+    return cols * width + (cols - 1) * gap, rows * height + (rows - 1) * gap
+
+
+class GridCanvas:
+    """
+    参数:
+        rows, cols: 行数和列数
+        width, height: 每个格子的尺寸
+        gap: 格子间隔
+        mode: 画布模式，L/RGB/RGBA
+        background: 背景色
+        array: 预先分配好的 (高, 宽, 通道) uint8 数组，不指定则在内存中分配
+
+    磁盘上的画布用 GridCanvas.mapped 创建；用完后调用 close（或用 with）释放数组
+    """
+
+    def __init__(self, rows, cols, width, height, gap, mode='RGB', background=(255, 255, 255),
+                 array=None):
+        if not HAS_NUMPY:
+            raise ImportError('GridCanvas 需要安装 numpy')
+        # 内存映射文件的路径，内存中的画布为None
+        self.path = None
+        self.rows, self.cols = rows, cols
+        self.width, self.height = width, height
+        self.mode = mode
+        self.size = grid_size(rows, cols, width, height, gap)
+        channels = MODE_CHANNELS[mode]
+        shape = (self.size[1], self.size[0], channels)
+        if array is None:
+            array = np.empty(shape, dtype=np.uint8)
+        elif array.shape != shape:
+            raise ValueError(f'画布数组形状应为 {shape}，实际为 {array.shape}')
+        self.array = array
+        # 一次向量化填充背景和所有间隔
+        self.array[...] = background if isinstance(background, int) else background[:channels]
+        # 跨步视图：cells[r, c] 即第 r 行第 c 列格子对应的 (高, 宽, 通道) 区域
+        s0, s1, s2 = self.array.strides
+        self.cells = as_strided(self.array, (rows, cols, height, width, channels),
+                                (s0 * (height + gap), s1 * (width + gap), s0, s1, s2))
+
+    @classmethod
+    def mapped(cls, rows, cols, width, height, gap, mode='RGB', background=(255, 255, 255), folder=None):
+        """
+        画布放在磁盘临时文件的内存映射中，大小只受磁盘空间限制，操作系统按需换入换出页面；
+        close 时关闭映射并删除文件
+
+        参数:
+            folder: 临时文件所在目录，不指定则使用系统临时目录
+            其余参数与 GridCanvas 相同
+        """
+        if not HAS_NUMPY:
+            raise ImportError('GridCanvas 需要安装 numpy')
+        width_total, height_total = grid_size(rows, cols, width, height, gap)
+        fd, path = tempfile.mkstemp(suffix='.canvas', dir=folder)
+        os.close(fd)
+        try:
+            array = np.memmap(path, dtype=np.uint8, mode='w+',
+                              shape=(height_total, width_total, MODE_CHANNELS[mode]))
+        except BaseException:
+            os.remove(path)
+            raise
+        canvas = cls(rows, cols, width, height, gap, mode, background, array)
+        canvas.path = path
+        return canvas
+
+    def close(self):
+        """
+        释放画布数组；磁盘画布同时关闭映射并删除文件
+        Windows 不能删除仍在映射中的文件，而调用方可能还引用着数组，所以显式关闭映射，
+        关闭后不能再访问 array、cells 或从中取出的切片
+        """
+        array, self.array, self.cells = self.array, None, None
+        if self.path is None:
+            return
+        array._mmap.close()
+        os.remove(self.path)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _tile_array(self, tile):
+        if tile.mode != self.mode:
+            tile = tile.convert(self.mode)
+        array = np.asarray(tile)
+        return array.reshape(self.height, self.width, -1)
+
+    def put(self, index, tile):
+        """把第 index 张图片直接赋值到对应格子，像素只复制一次"""
+        row, col = divmod(index, self.cols)
+        self.cells[row, col] = self._tile_array(tile)
+
+    def save_png(self, path, band_rows=BAND_ROWS):
+        """按条带从数组编码为PNG，不需要把整张画布转换为PIL图片"""
+        width, height = self.size
+        with PngStripWriter(path, width, height, self.mode) as writer:
+            for top in range(0, height, band_rows):
+                writer.write_bytes(self.array[top:top + band_rows].tobytes(),
+                                   min(band_rows, height - top))
+
+    def to_image(self):
+        """转换为PIL图片用于编码"""
+        array = self.array if self.array.shape[2] > 1 else self.array[:, :, 0]
+        return Image.fromarray(np.ascontiguousarray(array), self.mode)
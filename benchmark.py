@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+长图/矩阵拼接性能基准
+在本地生成合成图片集（截图类PNG、大尺寸相机JPEG、带透明通道的RGBA、混合宽高比），
+按 图片集 × 宽度 × 页数 × 格式 的组合运行 merge_image 和 merge_images，
+记录耗时、每秒图片数、每秒输出百万像素数和峰值内存，结果写入JSON便于对比两个版本
+
+示例:
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json
+    python benchmark.py --compare before.json after.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from profiler import peak_memory_kb
+
+# 合成图片集：名称 -> 图片数量，生成函数见 GENERATORS
+CORPORA = {
+    'screenshot': 40,
+    'camera': 12,
+    'alpha': 30,
+    'mixed': 40,
+}
+
+
+# 0-255均匀分布的标准差
+UNIFORM_SIGMA = 73.9
+
+
+def _screenshot(rng, index):
+    # 手机截图：1080x2400，大面积纯色+文字行，PNG
+    im = Image.new('RGB', (1080, 2400), (245, 245, 245))
+    draw = ImageDraw.Draw(im)
+    for y in range(120, 2400, 90):
+        color = tuple(rng.randrange(0, 120) for _ in range(3))
+        draw.rectangle((60, y, 60 + rng.randrange(300, 960), y + 40), fill=color)
+    return im, 'png'
+
+
+def _noise(rng, size, sigma):
+    # 以128为中心、标准差约为 sigma 的灰度噪声，全部由 rng 生成，同样的 seed 结果相同
+    # （Image.effect_noise 使用不受控制的随机数）
+    im = Image.frombytes('L', size, rng.randbytes(size[0] * size[1]))
+    scale = sigma / UNIFORM_SIGMA
+    return im.point(lambda v: round(128 + (v - 128) * scale))
+
+
+def _camera(rng, index):
+    # 相机照片：4000x3000，平滑渐变+噪点，JPEG
+    small = _noise(rng, (500, 375), 60).convert('RGB')
+    im = small.resize((4000, 3000), Image.Resampling.BICUBIC)
+    return im, 'jpg'
+
+
+def _alpha(rng, index):
+    # 带透明通道的贴图：RGBA PNG
+    size = (rng.randrange(400, 1200), rng.randrange(400, 1200))
+    im = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((0, 0, size[0] - 1, size[1] - 1),
+                 fill=tuple(rng.randrange(256) for _ in range(3)) + (200,))
+    return im, 'png'
+
+
+def _mixed(rng, index):
+    # 混合宽高比：横竖图交替，JPEG
+    size = rng.choice([(1600, 900), (900, 1600), (1200, 1200), (2000, 800)])
+    im = _noise(rng, (size[0] // 8, size[1] // 8), 40).convert('RGB').resize(size)
+    return im, 'jpg'
+
+
+GENERATORS = {
+    'screenshot': _screenshot,
+    'camera': _camera,
+    'alpha': _alpha,
+    'mixed': _mixed,
+}
+
+
+def generate_corpus(name, folder, count, seed=0):
+    """生成合成图片集，同样的 seed 每次生成相同的图片"""
+    rng = random.Random(f'{name}-{seed}')
+    os.makedirs(folder, exist_ok=True)
+    for index in range(1, count + 1):
+        im, ext = GENERATORS[name](rng, index)
+        im.save(os.path.join(folder, f'{index}.{ext}'), quality=90)
+    return folder
+
+
+def _peak_rss_kb():
+    # 用例进程与进程池子进程的峰值常驻内存之和（KB），非类Unix平台返回None
+    # 子进程在进程池关闭后才计入，与 --profile 报告使用同一个统计
+    own, children = peak_memory_kb()
+    if own is None:
+        return None
+    return own + children
+
+
+def _output_megapixels(paths):
+    total = 0
+    for path in paths:
+        with Image.open(path) as im:
+            total += im.size[0] * im.size[1]
+    return total / 1e6
+
+
+def run_case(case):
+    """
+    在当前进程中运行一个基准用例并返回结果
+    每个用例都在独立的子进程中运行，峰值内存互不影响
+    """
+    from main import merge_image, read_pic, list_images
+    from matrix_image_merge import merge_images
+
+    image_files = list_images(case['corpus_dir'])
+    out_dir = tempfile.mkdtemp(prefix='bench_out_')
+    try:
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            if case['mode'] == 'long':
+                merge_image(read_pic(image_files), case['format'], case['width'], 10,
+                            case['pages'], 80, out_dir, workers=case['workers'], incremental=False)
+            else:
+                merge_images(image_files, os.path.join(out_dir, 'merged.' + case['format']),
+                             gap=10, width=case['width'], workers=case['workers'])
+        elapsed = time.perf_counter() - started
+        outputs = [os.path.join(out_dir, f) for f in os.listdir(out_dir)
+                   if not f.endswith('.json')]
+        megapixels = _output_megapixels(outputs)
+        return dict(case,
+                    seconds=round(elapsed, 4),
+                    images_per_sec=round(len(image_files) / elapsed, 2),
+                    output_mpix_per_sec=round(megapixels / elapsed, 2),
+                    output_bytes=sum(os.path.getsize(p) for p in outputs),
+                    peak_rss_kb=_peak_rss_kb())
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def build_cases(corpus_dirs, widths, pages, formats, workers):
+    # 长图按 宽度×页数×格式 组合；矩阵只有一个输出，不区分页数
+    cases = []
+    for corpus, corpus_dir in corpus_dirs.items():
+        for width in widths:
+            for format in formats:
+                for n in pages:
+                    cases.append({'mode': 'long', 'corpus': corpus, 'corpus_dir': corpus_dir,
+                                  'width': width, 'pages': n, 'format': format, 'workers': workers})
+                cases.append({'mode': 'matrix', 'corpus': corpus, 'corpus_dir': corpus_dir,
+                              'width': max(1, width // 4), 'pages': 1, 'format': format,
+                              'workers': workers})
+    return cases
+
+
+def run_all(args):
+    corpus_root = args.corpus_dir or tempfile.mkdtemp(prefix='bench_corpus_')
+    corpus_dirs = {}
+    for name in args.corpora:
+        folder = os.path.join(corpus_root, name)
+        # 已经生成过的图片集直接复用
+        if not os.path.isdir(folder) or not os.listdir(folder):
+            print(f'生成图片集 {name} ...')
+            generate_corpus(name, folder, CORPORA[name], args.seed)
+        corpus_dirs[name] = folder
+
+    results = []
+    cases = build_cases(corpus_dirs, args.widths, args.pages, args.formats, args.workers)
+    for index, case in enumerate(cases, start=1):
+        # 每个用例放在独立子进程中，峰值内存和缓存状态互不干扰
+        proc = subprocess.run([sys.executable, __file__, '--run-case', json.dumps(case)],
+                              capture_output=True, text=True, cwd=str(Path(__file__).parent))
+        if proc.returncode != 0:
+            print(f'[{index}/{len(cases)}] 失败: {case}\n{proc.stderr}')
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"[{index}/{len(cases)}] {result['mode']:6} {result['corpus']:10} "
+              f"w={result['width']:<5} p={result['pages']:<2} {result['format']:4} "
+              f"{result['seconds']:8.3f}s {result['images_per_sec']:8.2f} img/s "
+              f"{result['output_mpix_per_sec']:8.2f} MP/s  峰值内存 {result['peak_rss_kb']} KB")
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'revision': _git_revision(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f'结果已保存至 {args.output}')
+    if not args.corpus_dir:
+        shutil.rmtree(corpus_root, ignore_errors=True)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=str(Path(__file__).parent)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _case_key(result):
+    return (result['mode'], result['corpus'], result['width'], result['pages'],
+            result['format'], result['workers'])
+
+
+def compare(before_path, after_path):
+    """对比两次运行的结果，打印每个用例的耗时和峰值内存变化"""
+    with open(before_path, encoding='utf-8') as f:
+        before = {_case_key(r): r for r in json.load(f)['results']}
+    with open(after_path, encoding='utf-8') as f:
+        after = {_case_key(r): r for r in json.load(f)['results']}
+    for key in sorted(before.keys() & after.keys(), key=str):
+        old, new = before[key], after[key]
+        speedup = old['seconds'] / new['seconds'] if new['seconds'] else float('inf')
+        rss = ''
+        if old.get('peak_rss_kb') and new.get('peak_rss_kb'):
+            rss = f"  内存 {old['peak_rss_kb']} -> {new['peak_rss_kb']} KB"
+        print(f"{key[0]:6} {key[1]:10} w={key[2]:<5} p={key[3]:<2} {key[4]:4} "
+              f"{old['seconds']:8.3f}s -> {new['seconds']:8.3f}s  x{speedup:.2f}{rss}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='长图/矩阵拼接性能基准')
+    parser.add_argument('-o', '--output', default='bench_results.json', help='结果JSON路径')
+    parser.add_argument('--corpus-dir', default=None, help='合成图片集目录，指定时保留并复用')
+    parser.add_argument('--corpora', nargs='+', default=list(CORPORA), choices=list(CORPORA))
+    parser.add_argument('--widths', nargs='+', type=int, default=[800])
+    parser.add_argument('--pages', nargs='+', type=int, default=[1, 9])
+    parser.add_argument('--formats', nargs='+', default=['png', 'jpg'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='对比两次运行的结果JSON')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+    elif args.compare:
+        compare(*args.compare)
+    else:
+        run_all(args)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
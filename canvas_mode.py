@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按页选择画布模式
+拼接前按页内图片的模式（来自元数据索引）选择灰度或彩色画布；拼接后再检查像素：
+颜色不超过256种时无损转为调色板(P)；三个通道完全相同时转为灰度(L)。
+指定误差阈值时，颜色稍多（缩放产生的抗锯齿边缘）的页面也量化到256色，与原图的
+均方根误差不超过阈值才采用，这一步是有损的，默认不开启。
+"""
+
+from PIL import Image, ImageChops, ImageStat
+from PIL.Image import Resampling
+
+# 视为灰度的输入模式
+GRAY_MODES = ('1', 'L', 'LA')
+# 各画布模式对应的背景色：有透明通道时背景透明，否则为白色
+BACKGROUNDS = {
+    'L': 255,
+    'LA': (255, 0),
+    'RGB': (255, 255, 255),
+    'RGBA': (255, 255, 255, 0),
+}
+# 能以调色板/灰度保存并因此变小的格式
+PALETTE_FORMATS = ('png', 'gif', 'bmp', 'tiff')
+GRAY_FORMATS = ('png', 'gif', 'bmp', 'tiff', 'jpg', 'jpeg')
+MAX_PALETTE_COLORS = 256
+# 颜色数超过此值的页面（照片等）不尝试量化，省去注定失败的量化和比较
+MAX_QUANTIZE_COLORS = 4096
+# 开启有损量化时建议的保真阈值：各通道均方根误差上限，1.5约相当于PSNR 44.6dB，肉眼看不出差别
+MAX_PALETTE_RMS = 1.5
+# 灰度检查先在按此步长取样的缩略图上进行，彩色页面可以很快排除
+SAMPLE_STEP = 8
+
+
+def page_mode(modes, alpha):
+    """
+    根据页内图片的模式选择画布模式
+
+    参数:
+        modes: 页内各图片的模式
+        alpha: 整次拼接是否使用透明背景（各页保持一致，间距的颜色不随页变化）
+    """
+    gray = bool(modes) and all(m in GRAY_MODES for m in modes)
+    if gray:
+        return 'LA' if alpha else 'L'
+    return 'RGBA' if alpha else 'RGB'
+
+
+def tile_convert(mode):
+    """画布模式对应的 load_image 转换规则：灰度画布直接把图片解码为灰度"""
+    return 'L' if mode in ('L', 'LA') else True
+
+
+def _is_gray(image):
+    # 最近邻取样得到的都是原图像素，取样不是灰度时整张也不是
+    w, h = image.size
+    sample = image.resize((max(1, w // SAMPLE_STEP), max(1, h // SAMPLE_STEP)), Resampling.NEAREST)
+    for im in (sample, image):
+        r, g, b = im.split()
+        if (ImageChops.difference(r, g).getbbox() is not None
+                or ImageChops.difference(g, b).getbbox() is not None):
+            return False
+    return True
+
+
+def _to_palette(image, colors, max_rms):
+    if len(colors) <= MAX_PALETTE_COLORS:
+        # 用页面中实际出现的颜色构造调色板，不抖动，每个像素映射到与自身相同的颜色
+        palette = []
+        for _, rgb in colors:
+            palette.extend(rgb)
+        palette_image = Image.new('P', (1, 1))
+        palette_image.putpalette(palette)
+        reduced = image.quantize(len(colors), palette=palette_image, dither=Image.Dither.NONE)
+        tolerance = 0
+    else:
+        reduced = image.quantize(MAX_PALETTE_COLORS, method=Image.Quantize.MEDIANCUT,
+                                 dither=Image.Dither.NONE)
+        tolerance = max_rms
+    # 保真检查：还原后与原图比较，无损路径要求逐像素相同
+    diff = ImageChops.difference(reduced.convert('RGB'), image)
+    if tolerance == 0:
+        return reduced if diff.getbbox() is None else None
+    return reduced if max(ImageStat.Stat(diff).rms) <= tolerance else None
+
+
+def reduce_mode(image, format, max_rms=0):
+    """
+    拼接完成后缩小画布模式，返回转换后的图片（不能转换时原样返回）；默认只做无损转换
+
+    参数:
+        image: 拼接好的RGB页面（其他模式原样返回）
+        format: 输出格式，决定能否使用调色板或灰度
+        max_rms: 大于0时允许有损量化，为各通道均方根误差上限（如 MAX_PALETTE_RMS）
+    """
+    format = format.lower()
+    if image.mode != 'RGB':
+        return image
+    # 颜色很少时调色板可以按1/2/4位保存，比灰度更小，所以先试调色板
+    if format in PALETTE_FORMATS:
+        colors = image.getcolors(MAX_QUANTIZE_COLORS if max_rms > 0 else MAX_PALETTE_COLORS)
+        reduced = _to_palette(image, colors, max_rms) if colors is not None else None
+        if reduced is not None:
+            return reduced
+    if format in GRAY_FORMATS and _is_gray(image):
+        return image.convert('L')
+    return image
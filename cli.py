@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+非交互式命令行入口
+一次运行可以处理多个原图文件夹，进程池、PIL等只初始化一次
+
+示例:
+    python cli.py long origin_pic -o result_pic --width 800 --pages 9
+    python cli.py long album1 album2 album3 -o result_pic --workers 8
+    python cli.py long origin_pic -o result_pic --format png --variant jpg:85 --variant webp:80:1080
+    python cli.py matrix origin_pic -o result_pic --rows 3 --gap 10
+    python cli.py spread scans -o spread_pic --workers 8 --rtl
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from main import merge_image, read_pic, list_images, plan_layout, preview_pages
+from image_index import image_info
+from matrix_image_merge import merge_images, plan_matrix, preview_matrix
+from double_page_spread import double_page_spread
+from image_worker import TileLoader
+from tile_cache import TileCache, DEFAULT_CACHE_SIZE, default_cache_dir
+from profiler import Profiler, NULL_PROFILER
+from array_canvas import DEFAULT_MMAP_THRESHOLD
+from dedupe import dedupe_paths, DEFAULT_THRESHOLD
+from watch import FolderWatcher, DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL
+from preview import DEFAULT_PREVIEW_SCALE
+from variants import parse_variant
+from canvas_mode import MAX_PALETTE_RMS
+
+
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError('必须为正整数')
+    return value
+
+
+def non_negative_int(text):
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError('不能为负数')
+    return value
+
+
+def positive_float(text):
+    value = float(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError('必须为正数')
+    return value
+
+
+def byte_size(text):
+    # 支持 500K、2M 这样的写法
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = text.strip().upper().removesuffix('B')
+    scale = units.get(text[-1:], 1)
+    try:
+        value = int(float(text[:-1] if scale > 1 else text) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError('无效的大小，例如 500K、2M')
+    if value <= 0:
+        raise argparse.ArgumentTypeError('必须为正数')
+    return value
+
+
+def variant_spec(text):
+    # 质量留空时在 run_long 中取 --quality
+    try:
+        return parse_variant(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('无效的输出格式，例如 webp:80、jpg:85:1080')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='长图/矩阵图片批量拼接')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # 两种模式共用的参数
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('inputs', nargs='+', help='原图文件夹，可以指定多个')
+    common.add_argument('-o', '--output', default='result_pic',
+                        help='结果文件夹；指定多个原图文件夹时在其下按文件夹名分别输出')
+    common.add_argument('--workers', type=positive_int, default=1, help='并行解码缩放的进程数')
+    common.add_argument('--reducing-gap', type=float, default=None,
+                        help='快速缩放容差(如2或3)，不指定则精确缩放')
+    common.add_argument('--cache-dir', default=None, help='缩放结果缓存目录，不指定则不缓存')
+    common.add_argument('--cache-size', type=byte_size, default=DEFAULT_CACHE_SIZE,
+                        help='缩放结果缓存的大小上限，如 512M')
+    common.add_argument('--canvas-threshold', type=positive_int, default=DEFAULT_MMAP_THRESHOLD,
+                        help='画布超过该字节数时改用磁盘画布（矩阵）或流式写出（长图），仅png')
+    common.add_argument('--memory-limit', type=byte_size, default=None,
+                        help='峰值内存上限，如 4G；按预估自动选择放得下的拼接方式，都放不下则跳过')
+    common.add_argument('--dedupe', choices=('drop', 'flag'), default=None,
+                        help='拼接前检测近似重复的图片：drop 去除，flag 只提示')
+    common.add_argument('--dedupe-threshold', type=non_negative_int, default=DEFAULT_THRESHOLD,
+                        help='近似重复的汉明距离阈值(0-64)')
+    common.add_argument('--profile', default=None, metavar='REPORT.json',
+                        help='输出分阶段性能统计报告')
+    common.add_argument('--preview', choices=('first', 'only'), default=None,
+                        help='先在结果文件夹的 preview 下生成低分辨率预览；only 只生成预览')
+    common.add_argument('--preview-scale', type=positive_float, default=DEFAULT_PREVIEW_SCALE,
+                        help='预览相对正式尺寸的比例')
+    common.add_argument('--watch', action='store_true',
+                        help='处理完后继续监视原图文件夹，有新图片时只重新生成受影响的输出')
+    common.add_argument('--debounce', type=positive_float, default=DEFAULT_DEBOUNCE,
+                        help='监视模式下连续多少秒没有新变化才开始处理')
+    common.add_argument('--poll-interval', type=positive_float, default=DEFAULT_POLL_INTERVAL,
+                        help='监视模式下的轮询间隔（秒），未安装 watchdog 时使用')
+
+    long_parser = subparsers.add_parser('long', parents=[common], help='垂直拼接为长图')
+    long_parser.add_argument('--format', default='png', help='输出图片格式')
+    long_parser.add_argument('--width', type=positive_int, default=800, help='长图宽度')
+    long_parser.add_argument('--space', type=non_negative_int, default=10, help='图片间距')
+    long_parser.add_argument('--pages', type=positive_int, default=9, help='输出页数')
+    long_parser.add_argument('--quality', type=int, default=80, help='压缩质量0-100')
+    long_parser.add_argument('--max-height', type=positive_int, default=None, help='单页最大高度')
+    long_parser.add_argument('--max-pixels', type=positive_int, default=None, help='单页最大像素数')
+    long_parser.add_argument('--streaming', action='store_true', help='按条带流式写出（仅png，未安装numpy时文件明显变大）')
+    long_parser.add_argument('--no-incremental', dest='incremental', action='store_false',
+                             help='忽略清单，重新生成所有页面')
+    long_parser.add_argument('--pipeline-depth', type=positive_int, default=2,
+                             help='同时存在的画布数上限')
+    long_parser.add_argument('--keep-mode', dest='adaptive_mode', action='store_false',
+                             help='不按页选择灰度/调色板模式，统一使用RGB(A)画布')
+    long_parser.add_argument('--lossy-palette', dest='palette_rms', action='store_const',
+                             const=MAX_PALETTE_RMS, default=0,
+                             help='颜色稍多于256种的页面也量化为调色板以减小png（有损，'
+                                  f'各通道均方根误差不超过{MAX_PALETTE_RMS}）；默认只做无损转换')
+    long_parser.add_argument('--max-bytes', type=byte_size, default=None,
+                             help='单页大小上限，如 5M；jpg/webp 在 --quality 以内自动选择质量')
+    long_parser.add_argument('--subsampling', choices=('4:4:4', '4:2:2', '4:2:0'), default=None,
+                             help='JPEG色度抽样，不指定则用PIL默认值')
+    long_parser.add_argument('--webp-method', type=int, choices=range(7), default=None,
+                             help='WebP压缩力度0-6，越大越慢、文件越小')
+    long_parser.add_argument('--variant', dest='variants', type=variant_spec, action='append', default=[],
+                             metavar='格式[:质量[:宽度]]',
+                             help='同一页另外输出的格式，可重复，如 --variant webp:80 --variant jpg:85:1080；'
+                                  '每页只拼接一次，缩小的版本从拼好的画布缩放')
+
+    matrix_parser = subparsers.add_parser('matrix', parents=[common], help='按矩阵拼接为一张图')
+    matrix_parser.add_argument('--name', default='merged.png', help='输出文件名')
+    matrix_parser.add_argument('--rows', type=positive_int, default=None, help='行数，不指定则自动计算')
+    matrix_parser.add_argument('--cols', type=positive_int, default=None, help='列数，不指定则自动计算')
+    matrix_parser.add_argument('--gap', type=non_negative_int, default=0, help='图片间隔像素')
+    matrix_parser.add_argument('--width', type=positive_int, default=None, help='每张图片的宽度')
+    matrix_parser.add_argument('--height', type=positive_int, default=None, help='每张图片的高度')
+    matrix_parser.add_argument('--layout', choices=('grid', 'justified'), default='grid',
+                               help='grid 统一尺寸网格；justified 等高行排版（保持原比例）')
+    matrix_parser.add_argument('--compositor', choices=('paste', 'numpy'), default='paste',
+                               help='拼接方式：逐张粘贴或NumPy网格数组')
+
+    spread_parser = subparsers.add_parser('spread', parents=[common], help='两两拼接为跨页')
+    spread_parser.add_argument('--format', default='jpg', help='输出格式')
+    spread_parser.add_argument('--height', type=positive_int, default=None,
+                               help='跨页高度，不指定则取两页中较矮的高度')
+    spread_parser.add_argument('--gap', type=non_negative_int, default=0, help='两页之间的间距')
+    spread_parser.add_argument('--quality', type=int, default=90, help='压缩质量0-100')
+    spread_parser.add_argument('--no-cover', dest='cover', action='store_false',
+                               help='第一页不单独作为封面')
+    spread_parser.add_argument('--back-cover', action='store_true', help='最后一页单独作为封底')
+    spread_parser.add_argument('--rtl', action='store_true', help='从右往左阅读，第一页放在右边')
+    return parser
+
+
+def output_dir(args, input_dir):
+    # 只有一个原图文件夹时直接输出到结果文件夹，否则按原图文件夹名分开
+    if len(args.inputs) == 1:
+        return args.output
+    return os.path.join(args.output, Path(input_dir).resolve().name)
+
+
+def readable_images(paths):
+    # 去掉读不出文件头的图片（还没拷贝完、已损坏或不是图片），并提示跳过了哪些
+    readable = []
+    for path in paths:
+        try:
+            image_info([path])
+        except (OSError, SyntaxError, ValueError) as e:
+            print(f'跳过无法读取的图片 {path}: {e}')
+            continue
+        readable.append(path)
+    return readable
+
+
+def input_images(args, input_dir):
+    # 列出文件夹中的图片，按需去除近似重复的图片
+    # 监视模式下文件可能正在写入，先跳过读不出的图片，文件写完后会再次触发处理
+    image_files = list_images(input_dir)
+    if args.watch:
+        image_files = readable_images(image_files)
+    if image_files and args.dedupe:
+        image_files = dedupe_paths(image_files, args.dedupe_threshold, args.dedupe)
+    return image_files
+
+
+def run_long(args, loader, input_dir):
+    image_files = input_images(args, input_dir)
+    if not image_files:
+        print(f'{input_dir} 中没有图片，跳过')
+        return
+    imgs = read_pic(image_files)
+    out_path = output_dir(args, input_dir)
+    plan = None
+    if args.preview:
+        # 预览和正式拼接共用同一次排版
+        plan = plan_layout(imgs, args.width, args.space, args.pages, args.max_height, args.max_pixels,
+                           loader.profiler)
+        preview_pages(imgs, plan, args.width, args.space, out_path, args.preview_scale, loader)
+        if args.preview == 'only':
+            return
+    merge_image(imgs, args.format, args.width, args.space, args.pages,
+                args.quality, out_path,
+                streaming=args.streaming, max_height=args.max_height, max_pixels=args.max_pixels,
+                incremental=args.incremental, pipeline_depth=args.pipeline_depth, loader=loader,
+                stream_threshold=args.canvas_threshold, adaptive_mode=args.adaptive_mode,
+                max_bytes=args.max_bytes, encode_options=encode_options(args), plan=plan,
+                memory_limit=args.memory_limit,
+                palette_rms=args.palette_rms,
+                variants=[v._replace(quality=args.quality) if v.quality is None else v for v in args.variants])
+
+
+def encode_options(args):
+    # 只传入用户指定的编码参数，其余沿用PIL默认值
+    options = {}
+    if args.subsampling is not None:
+        options['subsampling'] = args.subsampling
+    if args.webp_method is not None:
+        options['method'] = args.webp_method
+    return options or None
+
+
+def run_matrix(args, loader, input_dir):
+    image_paths = input_images(args, input_dir)
+    if not image_paths:
+        print(f'{input_dir} 中没有图片，跳过')
+        return
+    output_path = os.path.join(output_dir(args, input_dir), args.name)
+    plan = None
+    if args.preview:
+        plan = plan_matrix(image_paths, args.rows, args.cols, args.gap, args.width, args.height,
+                           args.layout)
+        preview_matrix(image_paths, plan, output_path, args.preview_scale, loader)
+        if args.preview == 'only':
+            return
+    merge_images(image_paths, output_path, args.rows, args.cols, args.gap, args.width, args.height,
+                 loader=loader, compositor=args.compositor, mmap_threshold=args.canvas_threshold,
+                 layout=args.layout, plan=plan, memory_limit=args.memory_limit)
+
+
+def run_spread(args, loader, input_dir):
+    image_paths = input_images(args, input_dir)
+    if not image_paths:
+        print(f'{input_dir} 中没有图片，跳过')
+        return
+    # 跨页在工作进程中直接写盘，使用共享的进程池
+    double_page_spread(image_paths, output_dir(args, input_dir), args.format, args.height, args.gap,
+                       args.quality, args.cover, args.back_cover, args.rtl,
+                       reducing_gap=args.reducing_gap, executor=loader.executor)
+
+
+def watch(args, loader, run):
+    # 常驻运行：进程池和缩放缓存保持不变，每批变化只重新处理有变化的文件夹，
+    # 长图按清单只重新生成输入变化了的页面
+    with FolderWatcher(args.inputs, list_images, args.debounce, args.poll_interval) as watcher:
+        print(f'\n开始监视（{watcher.mode}），按 Ctrl+C 退出')
+        try:
+            while True:
+                for input_dir, files in watcher.changes().items():
+                    started = time.time()
+                    print(f'\n处理 {input_dir}：{len(files)} 个文件有变化')
+                    try:
+                        run(args, loader, input_dir)
+                    except Exception as e:
+                        # 一个文件夹处理失败（如图片只拷贝了一半、解码出错）不退出监视，
+                        # 文件再次变化时会重新处理
+                        print(f'处理 {input_dir} 时出错，继续监视: {type(e).__name__}: {e}')
+                        continue
+                    finished = time.time()
+                    print(f'从放入到更新完成 {finished - min(files.values()):.2f} 秒'
+                          f'（处理 {finished - started:.2f} 秒）')
+                if loader.cache is not None:
+                    # 常驻运行不会走到 loader.close()，每批处理完按上限清理一次缓存
+                    loader.cache.evict()
+        except KeyboardInterrupt:
+            print('\n停止监视')
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run = {'long': run_long, 'matrix': run_matrix, 'spread': run_spread}[args.command]
+    cache_dir = args.cache_dir
+    if cache_dir is None and args.watch:
+        # 常驻运行时总是缓存缩放结果，重新生成时只有新图片需要解码
+        cache_dir = default_cache_dir()
+    cache = TileCache(cache_dir, args.cache_size) if cache_dir else None
+    profiler = Profiler() if args.profile else NULL_PROFILER
+    # 所有文件夹共用同一个进程池和缓存
+    with TileLoader(args.workers, args.reducing_gap, cache, profiler) as loader:
+        for input_dir in args.inputs:
+            print(f'\n处理 {input_dir}')
+            run(args, loader, input_dir)
+        if args.watch:
+            watch(args, loader, run)
+    if profiler.enabled:
+        print(profiler.summary())
+        profiler.save(args.profile)
+        print(f'性能统计已保存至 {args.profile}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
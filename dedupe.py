@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+近似重复图片检测
+对每张图片从极小的缩略图计算64位差值哈希(dHash)，缓存在元数据索引中；
+用BK树按汉明距离查找近似重复，避免两两比较的 O(n²)
+"""
+
+from PIL import Image
+from image_index import cached_field
+
+# 哈希边长，8 对应64位哈希
+HASH_SIZE = 8
+# 默认的汉明距离阈值，不超过该值视为近似重复
+DEFAULT_THRESHOLD = 4
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """
+    计算差值哈希：缩小到 (hash_size+1)×hash_size 的灰度图，比较每行相邻像素的明暗
+    JPEG 通过 draft 直接以最低分辨率解码，只需很少的解码工作
+    """
+    with Image.open(path) as im:
+        im.draft('L', (hash_size * 8, hash_size * 8))
+        small = im.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        line = pixels[row * (hash_size + 1):(row + 1) * (hash_size + 1)]
+        for col in range(hash_size):
+            value = (value << 1) | (line[col] > line[col + 1])
+    # 以十六进制字符串保存，便于写入JSON索引
+    return f'{value:0{hash_size * hash_size // 4}x}'
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    按汉明距离组织的BK树
+    查询距离不超过 threshold 的元素时，利用三角不等式只需访问少量子树
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = self.root
+        if node is None:
+            self.root = (value, item, {})
+            return
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, threshold):
+        """返回距离不超过 threshold 的 (距离, item) 列表"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= threshold:
+                results.append((distance, item))
+            for child_distance, child in children.items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return results
+
+
+def find_duplicates(paths, threshold=DEFAULT_THRESHOLD):
+    """
+    按顺序分组近似重复的图片，每组保留最先出现的一张
+
+    返回:
+        {保留图片的下标: [与其近似重复的图片下标, ...]}
+    """
+    hashes = cached_field(paths, 'dhash', dhash)
+    tree = BKTree()
+    groups = {}
+    for index, value in enumerate(hashes):
+        if value is None:
+            continue
+        value = int(value, 16)
+        matches = tree.search(value, threshold)
+        if matches:
+            keeper = min(matches)[1]
+            groups[keeper].append(index)
+        else:
+            tree.add(value, index)
+            groups[index] = []
+    return {keeper: dups for keeper, dups in groups.items() if dups}
+
+
+def dedupe_paths(paths, threshold=DEFAULT_THRESHOLD, action='drop'):
+    """
+    拼接前的去重预处理
+
+    参数:
+        paths: 图片路径列表
+        threshold: 汉明距离阈值
+        action: 'drop' 去除重复图片；'flag' 只打印重复分组，不改变图片列表
+    返回:
+        处理后的图片路径列表
+    """
+    groups = find_duplicates(paths, threshold)
+    if not groups:
+        return list(paths)
+    duplicates = set()
+    for keeper, dups in groups.items():
+        print(f"近似重复: {paths[keeper]} <- " + ', '.join(paths[i] for i in dups))
+        duplicates.update(dups)
+    if action != 'drop':
+        print(f"共发现 {len(duplicates)} 张近似重复的图片（未去除）")
+        return list(paths)
+    print(f"已去除 {len(duplicates)} 张近似重复的图片")
+    return [path for i, path in enumerate(paths) if i not in duplicates]
@@ -1,87 +1,244 @@
-# # 简单的跨页拼图处理
-# from PIL.Image import open, new, Resampling
-
-
-# # 自定义生成后固定路径
-# out_path = 'C:\Users\Admin\Pictures'
-
-# def double_page_spread():
-    
-#     is_config = input()
-    
-#     return
-
-
-
-
-# # 主函数运行
-# def main():
-    
-#     # 各参数默认值
-#     format = 'png'
-#     width = 800
-#     space = 10
-#     pages = 9
-#     quality = 80
-#     out_path = str(current_dir / '长图')
-    
-#     # 添加用户是否开启自定义设置功能    
-#     config_open =  is_customized('是否要自定义设置相关参数？(y/n): ')
-    
-#     # 若开启自定义设置，将用有效输入值替换默认值
-#     if config_open:
-        
-#         user_input = input('请输入要生成的图片格式。默认png，可选jpg等：').strip()
-#         if user_input:
-#             format = user_input
-
-#         user_input = input('输入长图宽，不输默认800：').strip()
-#         if user_input:
-#             try: 
-#                 width = int(user_input) if width else 800
-#             except ValueError:
-#                 print("未输入有效数字，将使用默认值800")
-
-#         user_input = input('输入图片间距，不输默认10：').strip()
-#         if user_input:
-#             try: 
-#                 space = int(user_input) if space else 10
-#             except ValueError:
-#                 print("未输入有效数字，将使用默认值10")
-
-#         user_input = input('输出多少张拼接图，不输默认9：').strip()
-#         if user_input:
-#             try: 
-#                 pages = int(user_input) if pages else 9
-#             except ValueError:
-#                 print("未输入有效数字，将使用默认值9")
-
-#         user_input = input('压缩质量0-100，不输默认80，数字越大质量越高：').strip()
-#         if user_input:
-#             try: 
-#                 quality = int(user_input) if quality else 80
-#             except ValueError:
-#                 print("未输入有效数字，将使用默认值80")
-
-#         user_input = input('输出文件夹，不输默认在当前目录下新建结果文件夹:').strip()
-#         if user_input:
-#             out_path = user_input
-
-#     print('\n结果图片格式: ', format)
-#     print('图片宽: ', width)
-#     print('图片间距: ', space)
-#     print('共输出' + str(pages) + '张图')
-#     print('压缩质量', quality)
-#     print('生成结果目录', out_path)
-
-#     try:
-#         merge_image(read_pic(), format, width, space, pages, quality, out_path)
-#         print('拼图完成\n')
-#     except Exception as e:
-#         # 处理所有异常
-#         print(f"发生了异常: {e}")
-
-
-# if __name__=='__main__':
-#     main()
-
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+跨页拼图
+把扫描的漫画、杂志按文件名自然顺序两两配对，左右拼成跨页：
+封面（以及可选的封底）单独成页，页数为奇数时最后一页单独输出；
+两页先按元数据索引统一到相同高度，每页只解码、缩放一次；
+每个跨页在进程池中独立完成解码、缩放、拼接和编码并直接写盘，主进程只分派任务
+"""
+
+import os
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from image_worker import resize_tile, save_image, create_executor
+from image_index import image_info, save_indexes
+from main import list_images, is_customized, current_dir, origin_pic_dir
+
+# 默认输出文件夹
+spread_pic_dir = current_dir / 'spread_pic'
+
+
+def pair_pages(paths, cover=True, back_cover=False):
+    """
+    按顺序把页面分组，返回 [(页面, ...), ...]，每组一页或两页
+
+    参数:
+        paths: 已按阅读顺序排好的页面
+        cover: 第一页（封面）单独成页，之后的第2、3页组成第一个跨页
+        back_cover: 最后一页（封底）单独成页
+    """
+    paths = list(paths)
+    head = [(paths.pop(0),)] if cover and paths else []
+    tail = [(paths.pop(),)] if back_cover and paths else []
+    pairs = [tuple(paths[i:i + 2]) for i in range(0, len(paths), 2)]
+    return head + pairs + tail
+
+
+def plan_spread(sizes, height=None, gap=0):
+    """
+    计算一组页面统一高度后的尺寸和画布宽度
+
+    参数:
+        sizes: 各页原始尺寸 (宽, 高)
+        height: 统一的高度，不指定时取较矮一页的高度（不放大）
+        gap: 两页之间的间距
+    返回:
+        (各页缩放后的尺寸, 画布宽, 画布高)
+    """
+    height = height or min(h for _, h in sizes)
+    scaled = [(max(1, round(w * height / h)), height) for w, h in sizes]
+    return scaled, sum(w for w, _ in scaled) + gap * (len(scaled) - 1), height
+
+
+def make_spread(paths, sizes, file_path, gap=0, rtl=False, alpha=False, reducing_gap=None, **params):
+    """
+    拼接并保存一个跨页，在工作进程中运行，返回写出的字节数
+
+    参数:
+        paths: 按阅读顺序的一页或两页
+        sizes: plan_spread 算出的各页尺寸
+        file_path: 输出文件
+        rtl: 从右往左阅读（日漫等），第一页放在右边
+        alpha: 使用透明背景（有透明页面且输出格式支持时）
+        reducing_gap: 快速缩放容差，见 resize_tile
+        params: 原样传给 Image.save，如 quality
+    """
+    width = sum(w for w, _ in sizes) + gap * (len(sizes) - 1)
+    height = sizes[0][1]
+    mode, color = ('RGBA', (255, 255, 255, 0)) if alpha else ('RGB', (255, 255, 255))
+    canvas = Image.new(mode, (width, height), color)
+    order = list(zip(paths, sizes))
+    if rtl:
+        order.reverse()
+    x = 0
+    for path, size in order:
+        # 每页只解码、缩放一次，粘贴后立即释放
+        page = resize_tile(path, size, reducing_gap=reducing_gap)
+        # 不透明画布上按透明通道合成到白底，透明画布直接保留原来的透明度
+        mask = page if page.mode in ('RGBA', 'LA') and not alpha else None
+        canvas.paste(page, (x, 0), mask)
+        page.close()
+        x += size[0] + gap
+    save_image(canvas, file_path, **params)
+    return os.path.getsize(file_path)
+
+
+def _make_spread_or_error(args):
+    # 进程池中出错时把异常作为结果返回，一个跨页失败不影响其他跨页
+    paths, sizes, file_path, options = args
+    try:
+        return make_spread(paths, sizes, file_path, **options)
+    except Exception as e:
+        return e
+
+
+def double_page_spread(image_paths, out_path, format='jpg', height=None, gap=0, quality=90,
+                       cover=True, back_cover=False, rtl=False, workers=1, reducing_gap=None,
+                       executor=None):
+    """
+    批量拼接跨页，返回生成的文件列表
+
+    参数:
+        image_paths: 页面路径，按文件名自然顺序配对
+        out_path: 输出文件夹
+        format: 输出格式
+        height: 跨页高度，不指定时每个跨页取两页中较矮的高度
+        gap: 两页之间的间距
+        quality: 压缩质量
+        cover / back_cover: 封面、封底单独成页，见 pair_pages
+        rtl: 从右往左阅读
+        workers: 并行的进程数，1为串行
+        reducing_gap: 快速缩放容差，不指定则精确缩放
+        executor: 共享的进程池（如 TileLoader.executor），指定时忽略 workers
+    """
+    started = time.perf_counter()
+    groups = pair_pages(image_paths, cover, back_cover)
+    if not groups:
+        print('没有可拼接的页面。')
+        return []
+    os.makedirs(out_path, exist_ok=True)
+    alpha_format = format.lower() in ('png', 'webp')
+    infos = {path: info for path, info in zip(image_paths, image_info(image_paths))}
+
+    # 排版只用元数据，在主进程一次算完；任务里只有路径和尺寸，传给工作进程的数据很少
+    jobs = []
+    digits = len(str(len(groups)))
+    for i, paths in enumerate(groups, start=1):
+        sizes, _, _ = plan_spread([(infos[p]['width'], infos[p]['height']) for p in paths], height, gap)
+        file_path = os.path.join(out_path, f'{i:0{digits}d}.{format}')
+        alpha = alpha_format and any(infos[p]['has_alpha'] for p in paths)
+        options = dict(gap=gap, rtl=rtl, alpha=alpha, reducing_gap=reducing_gap, quality=quality)
+        jobs.append((paths, sizes, file_path, options))
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_executor(workers)
+    mapper = executor.map if executor is not None else map
+    written = []
+    total_bytes = 0
+    try:
+        # 结果按顺序返回，写盘已经在工作进程中完成
+        for (paths, _, file_path, _), result in zip(jobs, mapper(_make_spread_or_error, jobs)):
+            if isinstance(result, Exception):
+                print(f'拼接 {" + ".join(Path(p).name for p in paths)} 时出错: {result}')
+                continue
+            written.append(file_path)
+            total_bytes += result
+    finally:
+        if own_executor and executor is not None:
+            executor.shutdown()
+
+    save_indexes()
+    elapsed = time.perf_counter() - started
+    print(f'\n页面总数: {len(image_paths)}')
+    print(f'输出: {len(written)} 张（其中单页 {sum(len(g) == 1 for g in groups)} 张）')
+    print(f'耗时 {elapsed:.2f} 秒，共写出 {total_bytes / (1 << 20):.1f}MB，保存至 {out_path}')
+    return written
+
+
+# 主函数运行
+def main():
+
+    if not os.path.exists(origin_pic_dir):
+        os.mkdir(origin_pic_dir)
+
+    # 各参数默认值
+    format = 'jpg'
+    height = None
+    gap = 0
+    quality = 90
+    cover = True
+    rtl = False
+    workers = os.cpu_count() or 1
+    out_path = str(spread_pic_dir)
+
+    # 添加用户是否开启自定义设置功能
+    config_open = is_customized('是否要自定义设置相关参数？(y/n): ')
+
+    # 若开启自定义设置，将用有效输入值替换默认值
+    if config_open:
+
+        user_input = input('请输入要生成的图片格式。默认jpg，可选png等：').strip()
+        if user_input:
+            format = user_input
+
+        user_input = input('输入跨页高度，不输则取两页中较矮的高度：').strip()
+        if user_input:
+            try:
+                height = int(user_input)
+            except ValueError:
+                print("未输入有效数字，将取两页中较矮的高度")
+
+        user_input = input('输入两页之间的间距，不输默认0：').strip()
+        if user_input:
+            try:
+                gap = int(user_input)
+            except ValueError:
+                print("未输入有效数字，将使用默认值0")
+
+        user_input = input('压缩质量0-100，不输默认90，数字越大质量越高：').strip()
+        if user_input:
+            try:
+                quality = int(user_input)
+            except ValueError:
+                print("未输入有效数字，将使用默认值90")
+
+        cover = is_customized('第一页是否为单独的封面？(y/n): ')
+        rtl = is_customized('是否从右往左阅读（日漫）？(y/n): ')
+
+        user_input = input(f'并行处理的进程数，不输默认{workers}：').strip()
+        if user_input:
+            try:
+                workers = int(user_input)
+            except ValueError:
+                print(f"未输入有效数字，将使用默认值{workers}")
+
+        user_input = input('输出文件夹，不输默认在当前目录下新建跨页文件夹:').strip()
+        if user_input:
+            out_path = user_input
+
+    print('\n结果图片格式: ', format)
+    print('跨页高度: ', '取较矮一页' if height is None else height)
+    print('两页间距: ', gap)
+    print('压缩质量', quality)
+    print('封面单独成页', '是' if cover else '否')
+    print('阅读方向', '从右往左' if rtl else '从左往右')
+    print('并行进程数', workers)
+    print('生成结果目录', out_path)
+
+    try:
+        double_page_spread(list_images(origin_pic_dir), out_path, format, height, gap, quality,
+                           cover=cover, rtl=rtl, workers=workers)
+        print('拼图完成\n')
+    except Exception as e:
+        # 处理所有异常
+        print(f"发生了异常: {e}")
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+拼接前的资源预估
+只用元数据索引中的尺寸和排版结果，在解码任何图片之前估算画布像素数、各种拼接方式的
+峰值内存和大致的解码、编码耗时；指定内存上限时按预估选择能放得下的方式，都放不下则拒绝。
+吞吐量是按单核粗略测得的量级，只用于判断快慢，不是精确的耗时
+"""
+
+from collections import namedtuple
+
+from array_canvas import canvas_bytes
+
+# 解释器、PIL等的固定开销
+BASE_MEMORY = 64 << 20
+# 解码时原图按4通道计；转换模式时新旧两份同时存在
+DECODE_CHANNELS = 4
+DECODE_COPIES = 2
+# 内存画布编码时编码器和内存碎片大约还要再占一张画布
+ENCODE_COPIES = 1
+# 单核吞吐量（像素/秒）
+DECODE_RATE = 60e6
+ENCODE_RATES = {'png': 5e6, 'jpg': 60e6, 'jpeg': 60e6, 'webp': 5e6}
+DEFAULT_ENCODE_RATE = 5e6
+
+# 各拼接方式的说明
+ENGINE_NAMES = {
+    'memory': '内存画布',
+    'memory_single': '内存画布（不重叠编码）',
+    'streaming': '按条带流式写出',
+    'mmap': '磁盘内存映射画布',
+}
+
+Estimate = namedtuple('Estimate', 'pages pixels largest_canvas decode_peak peaks decode_seconds encode_seconds')
+
+
+def estimate_resources(canvases, sources, mode, format, workers=1, depth=1, engines=('memory',),
+                       variants=(), budget_copies=0):
+    """
+    估算一次拼接的资源占用
+
+    参数:
+        canvases: 各输出画布的 (宽, 高)
+        sources: 全部原图的 (宽, 高)
+        mode: 画布模式
+        format: 输出格式
+        workers: 并行解码的进程数
+        depth: 同时存在的画布数（长图流水线深度）
+        engines: 要估算的拼接方式，见 ENGINE_NAMES
+        variants: 同一张画布另外输出的 (格式, 宽度)，宽度为None表示不缩小
+        budget_copies: 按大小预算搜索质量时各编码线程持有的画布副本数
+    返回:
+        Estimate，其中 peaks 为 {拼接方式: 峰值内存字节数}
+    """
+    workers = max(1, workers or 1)
+    largest = max((canvas_bytes(w, h, mode) for w, h in canvases), default=0)
+    source_pixels = [w * h for w, h in sources]
+    # 每个工作进程同时只解码一张原图
+    decode_peak = max(source_pixels, default=0) * DECODE_CHANNELS * DECODE_COPIES * workers
+    # 并行时进程池会提前算好一页的全部缩放结果，最多约等于一张画布
+    prefetch = largest if workers > 1 else 0
+    base = BASE_MEMORY + decode_peak + prefetch
+    pixels = sum(w * h for w, h in canvases)
+    encode_seconds = pixels / ENCODE_RATES.get(format.lower(), DEFAULT_ENCODE_RATE)
+    # 其他格式与主格式同时编码，各自多占一份（可能缩小了的）画布
+    variant_copies = budget_copies * largest
+    for variant_format, variant_width in variants:
+        scales = [min(1, variant_width / w) ** 2 if variant_width else 1 for w, _ in canvases]
+        variant_copies += largest * max(scales, default=0)
+        encode_seconds += (sum(w * h * s for (w, h), s in zip(canvases, scales))
+                           / ENCODE_RATES.get(variant_format.lower(), DEFAULT_ENCODE_RATE))
+    canvas_peaks = {
+        'memory': (depth + ENCODE_COPIES) * largest + variant_copies,
+        'memory_single': (1 + ENCODE_COPIES) * largest + variant_copies,
+        'streaming': 0,
+        'mmap': 0,
+    }
+    return Estimate(
+        pages=len(canvases),
+        pixels=pixels,
+        largest_canvas=largest,
+        decode_peak=decode_peak,
+        peaks={engine: int(base + canvas_peaks[engine]) for engine in engines},
+        decode_seconds=sum(source_pixels) / DECODE_RATE / workers,
+        encode_seconds=encode_seconds,
+    )
+
+
+def choose_engine(estimate, memory_limit):
+    """按顺序返回第一个峰值内存不超过上限的拼接方式，没有上限时返回第一个，都放不下时返回None"""
+    for engine, peak in estimate.peaks.items():
+        if memory_limit is None or peak <= memory_limit:
+            return engine
+    return None
+
+
+def _mb(value):
+    return f'{value / (1 << 20):.0f}MB'
+
+
+def describe(estimate, engine=None):
+    # 一行可读的预估结果
+    peaks = '，'.join(f'{ENGINE_NAMES[e]} {_mb(p)}' for e, p in estimate.peaks.items())
+    text = (f'预估：{estimate.pages} 张输出，共 {estimate.pixels / 1e6:.1f} 百万像素，'
+            f'最大画布 {_mb(estimate.largest_canvas)}，解码峰值 {_mb(estimate.decode_peak)}；'
+            f'峰值内存 {peaks}；解码约 {estimate.decode_seconds:.1f} 秒，编码约 {estimate.encode_seconds:.1f} 秒')
+    if engine is not None:
+        text += f'\n选择：{ENGINE_NAMES[engine]}'
+    return text
+
+
+def refuse_message(estimate, memory_limit):
+    lowest = min(estimate.peaks.values())
+    return (f'预估峰值内存至少 {_mb(lowest)}，超过上限 {_mb(memory_limit)}，不执行。'
+            f'可以减少进程数、降低宽度或限制单页高度后重试')
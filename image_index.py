@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片元数据索引
+在图片所在文件夹保存一个JSON索引（.image_index.json），按 文件名+修改时间+文件大小 缓存
+尺寸、模式、是否透明、EXIF方向等信息。只有新增或改动过的文件才会重新读取文件头，
+排版和分页可以完全基于索引计算，不必再打开每一张图片。
+每个文件夹的索引在一次运行中只读取一次并保存在内存中，由 save_indexes 统一写回
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+INDEX_NAME = '.image_index.json'
+# 索引格式变化时递增，旧索引会被整体丢弃
+INDEX_VERSION = 1
+# EXIF 中表示方向的标签
+EXIF_ORIENTATION = 0x0112
+
+
+def read_header(path):
+    # 只读取文件头获取元数据，不解码像素
+    with Image.open(path) as im:
+        has_alpha = im.mode in ('RGBA', 'LA', 'PA') or 'transparency' in im.info
+        try:
+            orientation = im.getexif().get(EXIF_ORIENTATION, 1)
+        except Exception:
+            orientation = 1
+        return {
+            'width': im.size[0],
+            'height': im.size[1],
+            'mode': im.mode,
+            'format': im.format,
+            'has_alpha': has_alpha,
+            'orientation': orientation,
+        }
+
+
+class ImageIndex:
+    """
+    单个文件夹的元数据索引
+
+    用法:
+        index = ImageIndex(folder)
+        info = index.get(path)
+        index.save()
+    """
+
+    def __init__(self, folder):
+        self.folder = str(folder)
+        self.path = os.path.join(self.folder, INDEX_NAME)
+        self.entries = {}
+        self.dirty = False
+        # 保存失败（如文件夹只读）后不再尝试，索引只在内存中生效
+        self.writable = True
+        # 服务等场景下多个线程会同时读写同一个索引
+        self._lock = threading.RLock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError):
+            # 索引不存在或损坏时重新建立
+            self.entries = {}
+
+    def _stat_key(self, path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, path):
+        """返回图片的元数据，文件改动过或不在索引中时重新读取文件头"""
+        name = os.path.basename(path)
+        mtime, size = self._stat_key(path)
+        with self._lock:
+            entry = self.entries.get(name)
+        if entry is None or entry['mtime'] != mtime or entry['size'] != size:
+            entry = read_header(path)
+            entry['mtime'] = mtime
+            entry['size'] = size
+            with self._lock:
+                self.entries[name] = entry
+                self.dirty = True
+        return entry
+
+    def update(self, path, **fields):
+        """在已有记录上追加额外字段（如内容哈希），文件改动后这些字段随记录一起失效"""
+        entry = self.get(path)
+        with self._lock:
+            entry.update(fields)
+            self.dirty = True
+        return entry
+
+    def prune(self):
+        # 删除文件夹中已经不存在的文件的记录
+        try:
+            existing = set(os.listdir(self.folder))
+        except OSError:
+            return
+        with self._lock:
+            for name in set(self.entries) - existing:
+                del self.entries[name]
+                self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty or not self.writable:
+                return
+            # 先写临时文件再替换，避免中途退出留下损坏的索引；临时文件名区分进程和线程，同时保存时互不覆盖
+            tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': INDEX_VERSION, 'entries': self.entries}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+            except OSError as e:
+                self.writable = False
+                print(f"无法保存图片索引 {self.path}，本次运行中只在内存中使用: {e}")
+
+
+# 本次运行中已经读取的索引 {文件夹: ImageIndex}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(folder):
+    """返回文件夹的索引，同一个文件夹在一次运行中只从磁盘读取一次"""
+    folder = os.path.abspath(folder)
+    with _indexes_lock:
+        index = _indexes.get(folder)
+        if index is None:
+            index = _indexes[folder] = ImageIndex(folder)
+        return index
+
+
+def forget_index(folder):
+    """丢弃文件夹的索引，不写回；删除临时文件夹前调用，长期运行的服务不会积累已删除文件夹的索引"""
+    with _indexes_lock:
+        _indexes.pop(os.path.abspath(folder), None)
+
+
+def save_indexes():
+    """清理已删除文件的记录并写回所有改动过的索引，拼接结束时和程序退出时调用"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        if index.dirty:
+            index.prune()
+            index.save()
+
+
+atexit.register(save_indexes)
+
+
+def content_hash(path, chunk_size=1 << 20):
+    # 计算文件内容的SHA-1，分块读取避免大文件占用内存
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _lookup(paths, fetch):
+    # 对每个路径用所在文件夹的索引调用 fetch(index, path)；改动只记在内存中，由 save_indexes 写回
+    return [fetch(open_index(os.path.dirname(os.path.abspath(path))), path) for path in paths]
+
+
+def image_info(paths):
+    """
+    批量获取图片元数据，按所在文件夹读取并更新各自的索引
+
+    参数:
+        paths: 图片路径列表
+    返回:
+        与 paths 一一对应的元数据字典列表
+    """
+    return _lookup(paths, lambda index, path: index.get(path))
+
+
+def rename_entries(folder, names):
+    """
+    按 {旧文件名: 新文件名} 移动索引中的记录（连同内容哈希等派生字段），
+    改名不改变修改时间和大小，改名后的文件不会被当作新文件重新读取、计算哈希
+    """
+    index = open_index(folder)
+    with index._lock:
+        # 先全部取出再放回，新旧文件名互相交换时不会互相覆盖
+        entries = {new: index.entries.pop(old) for old, new in names.items() if old in index.entries}
+        index.entries.update(entries)
+        index.dirty = True
+    # 改名已经完成，立即写回
+    index.save()
+
+
+def _precompute(paths, field, compute, workers):
+    # 找出索引中还没有该字段的文件，在线程池中并发计算（哈希计算和读文件时会释放GIL）
+    def missing(index, path):
+        try:
+            return field not in index.get(path)
+        except OSError:
+            return False
+    todo = [path for path, m in zip(paths, _lookup(paths, missing)) if m]
+
+    def attempt(path):
+        try:
+            return compute(path)
+        except OSError as e:
+            return e
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(todo, executor.map(attempt, todo)))
+
+
+def cached_field(paths, field, compute, workers=1):
+    """
+    批量获取按文件缓存在索引中的派生数据（如内容哈希、感知哈希）
+    文件未改动时直接使用索引中的值，否则调用 compute(path) 重新计算
+
+    参数:
+        workers: 大于1时用多个线程并发计算缺少的值
+    返回:
+        与 paths 一一对应的值列表，无法读取的图片对应None
+    """
+    if workers > 1:
+        computed = _precompute(paths, field, compute, workers)
+        serial = compute
+
+        def compute(path):
+            value = computed.pop(path) if path in computed else serial(path)
+            if isinstance(value, OSError):
+                raise value
+            return value
+
+    def fetch(index, path):
+        try:
+            entry = index.get(path)
+            if field not in entry:
+                entry = index.update(path, **{field: compute(path)})
+        except OSError:
+            return None
+        return entry[field]
+    return _lookup(paths, fetch)
+
+
+def image_hashes(paths, workers=1):
+    """
+    批量获取图片内容哈希，文件未改动时直接使用索引中缓存的值
+
+    参数:
+        workers: 大于1时并发计算新文件的哈希
+    返回:
+        与 paths 一一对应的SHA-1十六进制字符串列表，无法读取的图片对应None
+    """
+    return cached_field(paths, 'sha1', content_hash, workers)
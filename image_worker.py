@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片解码与缩放的公共工作函数
+长图拼接和矩阵拼接共用，支持用进程池把解码+缩放分摊到多个CPU核心
+"""
+
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from image_index import image_hashes
+from tile_cache import tile_key
+from profiler import NULL_PROFILER
+
+# 带调色板的模式只保存像素索引会丢失调色板，不放入缓存
+UNCACHEABLE_MODES = ('P', 'PA')
+
+
+def load_image(path, convert=True, draft_size=None):
+    """
+    打开并解码一张图片
+
+    参数:
+        path: 图片路径
+        convert: 为True时，除RGBA/LA外的图片统一转换为RGB（长图拼接的规则）；
+                 为'L'时，除L/LA外的图片统一转换为L（灰度页面）
+        draft_size: 指定时，JPEG在DCT域按1/2、1/4、1/8直接解码到不小于该尺寸
+    """
+    im = Image.open(path)
+    if draft_size is not None and im.format == 'JPEG':
+        im.draft(None, draft_size)
+    # 如果图片是包含透明通道的RGBA/LA（灰度图）模式，保持原样
+    # 如果是其他模式且不包含透明通道，转换为RGB
+    keep, target = (('L', 'LA'), 'L') if convert == 'L' else (('RGBA', 'LA'), 'RGB')
+    if convert and im.mode not in keep:
+        converted = im.convert(target)
+        im.close()
+        return converted
+    im.load()
+    return im
+
+
+def resize_tile(path, size, convert=True, reducing_gap=None, cache=None, key=None, stats=None):
+    """
+    解码并等比缩放单张图片，原图解码后立即释放
+
+    参数:
+        reducing_gap: 为None时完整解码后直接LANCZOS缩放（最精确）；
+            指定数值时启用快速路径：JPEG先按draft降采样解码，其余格式先用整数倍reduce()，
+            都保证中间结果不小于目标尺寸的 reducing_gap 倍，再做最后一步LANCZOS。
+            数值越大越接近精确结果，一般取2~3即可与精确结果肉眼无差别
+        cache: TileCache 缩放结果缓存，命中时直接返回缓存中的图片
+        key: 该图片在缓存中的键，见 tile_cache.tile_key
+        stats: 传入字典时记录各阶段耗时和计数（性能统计用）
+    """
+    if key is None:
+        cache = None
+    if cache is not None:
+        started = time.perf_counter()
+        tile = cache.get(key)
+        if tile is not None:
+            if stats is not None:
+                stats.update(cache_hit=True, decode=time.perf_counter() - started, resize=0.0,
+                             bytes_read=len(tile.getbands()) * tile.size[0] * tile.size[1],
+                             source_pixels=0, pixels=tile.size[0] * tile.size[1])
+            return tile
+    size = tuple(size)
+    draft_size = None
+    if reducing_gap is not None:
+        draft_size = (int(size[0] * reducing_gap), int(size[1] * reducing_gap))
+    started = time.perf_counter()
+    src = load_image(path, convert, draft_size)
+    decoded = time.perf_counter()
+    tile = src.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+    if stats is not None:
+        stats.update(cache_hit=False, decode=decoded - started, resize=time.perf_counter() - decoded,
+                     bytes_read=os.path.getsize(path), source_pixels=src.size[0] * src.size[1],
+                     pixels=size[0] * size[1])
+    src.close()
+    if cache is not None and tile.mode not in UNCACHEABLE_MODES:
+        cache.put(key, tile)
+    return tile
+
+
+def _resize_tile_or_error(path, size, convert, reducing_gap, cache, key):
+    # 进程池中出错时把异常作为结果返回，由调用方决定如何处理
+    try:
+        return resize_tile(path, size, convert, reducing_gap, cache, key)
+    except Exception as e:
+        return e
+
+
+def _profiled_resize_tile(path, size, convert, reducing_gap, cache, key, return_errors):
+    # 开启性能统计时使用：连同各阶段耗时一起返回，便于在主进程汇总
+    stats = {}
+    try:
+        tile = resize_tile(path, size, convert, reducing_gap, cache, key, stats)
+    except Exception as e:
+        if not return_errors:
+            raise
+        tile = e
+    return tile, stats
+
+
+def save_image(image, file_path, profiler=NULL_PROFILER, **params):
+    """
+    编码并保存图片，params 原样传给 Image.save
+    开启性能统计时先编码到内存再写盘，分别计入 encode 和 write 两个阶段
+    """
+    if not profiler.enabled:
+        image.save(file_path, **params)
+        return
+    buffer = io.BytesIO()
+    format = Image.registered_extensions().get(os.path.splitext(file_path)[1].lower())
+    with profiler.stage('encode', pixels=image.size[0] * image.size[1]):
+        image.save(buffer, format=format, **params)
+    save_bytes(buffer.getvalue(), file_path, profiler)
+
+
+def save_bytes(data, file_path, profiler=NULL_PROFILER):
+    """把已经编码好的图片写盘，计入 write 阶段"""
+    with profiler.stage('write', bytes_written=len(data)):
+        with open(file_path, 'wb') as f:
+            f.write(data)
+
+
+def create_executor(workers):
+    # workers 大于1时才创建进程池，否则走串行路径
+    if workers and workers > 1:
+        return ProcessPoolExecutor(max_workers=workers)
+    return None
+
+
+def resized_tiles(paths, sizes, executor=None, convert=True, return_errors=False, reducing_gap=None,
+                  cache=None, profiler=None):
+    """
+    按输入顺序逐张产出缩放后的图片
+
+    参数:
+        paths: 图片路径列表
+        sizes: 与路径一一对应的目标尺寸
+        executor: create_executor 返回的进程池，为None时在当前进程串行处理
+        convert: 同 load_image
+        return_errors: 为True时出错的图片以异常对象代替，不中断整体处理
+        reducing_gap: 同 resize_tile，为None时使用精确缩放
+        cache: TileCache 缩放结果缓存，不指定则不使用缓存
+        profiler: Profiler 性能统计，开启时记录每张图片的解码、缩放耗时
+    """
+    worker = _resize_tile_or_error if return_errors else resize_tile
+    n = len(paths)
+    converts = [convert] * n
+    gaps = [reducing_gap] * n
+    caches = [cache] * n
+    keys = [None] * n
+    if cache is not None:
+        # 内容哈希由元数据索引缓存，文件未改动时不会重新读取
+        keys = [None if h is None else tile_key(h, size, convert, reducing_gap)
+                for h, size in zip(image_hashes(paths), sizes)]
+    if profiler is not None and profiler.enabled:
+        yield from _profiled_tiles(paths, sizes, executor, converts, gaps, caches, keys,
+                                   return_errors, profiler)
+    elif executor is None:
+        yield from map(worker, paths, sizes, converts, gaps, caches, keys)
+    else:
+        yield from executor.map(worker, paths, sizes, converts, gaps, caches, keys)
+
+
+def _profiled_tiles(paths, sizes, executor, converts, gaps, caches, keys, return_errors, profiler):
+    # 与 resized_tiles 相同，另外把每张图片的统计汇总到 profiler
+    errors = [return_errors] * len(paths)
+    mapper = map if executor is None else executor.map
+    results = mapper(_profiled_resize_tile, paths, sizes, converts, gaps, caches, keys, errors)
+    for path, (tile, stats) in zip(paths, results):
+        if stats:
+            profiler.add('decode', stats['decode'], bytes_read=stats['bytes_read'],
+                         pixels=stats['source_pixels'], cache_hits=int(stats['cache_hit']))
+            profiler.add('resize', stats['resize'], pixels=stats['pixels'])
+            profiler.tile(path=path, **stats)
+        yield tile
+
+
+class TileLoader:
+    """
+    解码+缩放的执行配置：进程池、快速缩放容差和缩放缓存
+    拼接函数只需要接收一个 TileLoader，不必逐个传递这些参数
+
+    参数:
+        workers: 并行解码缩放的进程数，1为串行
+        reducing_gap: 快速缩放容差，见 resize_tile
+        cache: TileCache 缩放结果缓存
+        profiler: Profiler 性能统计，不指定则不统计
+    """
+
+    def __init__(self, workers=1, reducing_gap=None, cache=None, profiler=NULL_PROFILER):
+        self.executor = create_executor(workers)
+        self.workers = workers if self.executor is not None else 1
+        self.reducing_gap = reducing_gap
+        self.cache = cache
+        self.profiler = profiler
+
+    def tiles(self, paths, sizes, convert=True, return_errors=False):
+        # 按输入顺序逐张产出缩放后的图片
+        return resized_tiles(paths, sizes, self.executor, convert, return_errors,
+                             self.reducing_gap, self.cache, self.profiler)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.cache is not None:
+            self.cache.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
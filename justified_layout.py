@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+等高行排版（justified rows）
+每一行的图片缩放到同一高度，使整行恰好填满目标宽度，图片不变形、不需要留白补齐。
+用动态规划在宽高比序列上选择断行位置，使各行高度尽量接近目标行高；
+每行图片数有上限，复杂度为 O(n × 每行最多张数)，对 n 是线性的
+"""
+
+
+def _row_height(ratio_sum, count, width, gap):
+    # 宽高比之和为 ratio_sum 的 count 张图片填满 width 时的行高
+    return (width - gap * (count - 1)) / ratio_sum
+
+
+def justify_rows(ratios, width, target_height, gap=0, max_per_row=None):
+    """
+    选择断行位置
+
+    参数:
+        ratios: 每张图片的宽高比（宽/高）
+        width: 画布宽度
+        target_height: 目标行高
+        gap: 图片间隔
+        max_per_row: 每行最多张数，不指定时按目标行高估算
+    返回:
+        各行的 (start, end) 下标区间列表
+    """
+    n = len(ratios)
+    if n == 0:
+        return []
+    if max_per_row is None:
+        # 行高低于目标一半的行代价很大，不必再考虑更长的行
+        min_ratio = min(ratios)
+        max_per_row = max(1, int(2 * width / (target_height * min_ratio)) + 1)
+
+    inf = float('inf')
+    # best[j]：前 j 张图片排版的最小代价；cut[j]：最后一行的起点
+    best = [0.0] + [inf] * n
+    cut = [0] * (n + 1)
+    for end in range(1, n + 1):
+        ratio_sum = 0.0
+        for start in range(end - 1, max(-1, end - 1 - max_per_row), -1):
+            ratio_sum += ratios[start]
+            count = end - start
+            # 每张图片至少要有1像素宽
+            if width - gap * (count - 1) < count:
+                break
+            height = _row_height(ratio_sum, count, width, gap)
+            if end == n and height > target_height:
+                # 最后一行不强行拉伸填满，按目标行高排版即可
+                cost = 0.0
+            else:
+                cost = (height - target_height) ** 2
+            if best[start] + cost < best[end]:
+                best[end] = best[start] + cost
+                cut[end] = start
+
+    rows = []
+    end = n
+    while end > 0:
+        rows.append((cut[end], end))
+        end = cut[end]
+    return rows[::-1]
+
+
+def layout_rows(sizes, width, target_height, gap=0, max_per_row=None):
+    """
+    计算每张图片缩放后的尺寸和位置
+
+    参数:
+        sizes: 每张图片的原始尺寸 (宽, 高)
+    返回:
+        (boxes, total_height)：boxes 为与 sizes 一一对应的 (x, y, 宽, 高)
+    """
+    ratios = [w / h for w, h in sizes]
+    rows = justify_rows(ratios, width, target_height, gap, max_per_row)
+    boxes = [None] * len(sizes)
+    top = 0
+    for start, end in rows:
+        ratio_sum = sum(ratios[start:end])
+        count = end - start
+        exact = _row_height(ratio_sum, count, width, gap)
+        last_unfilled = end == len(sizes) and exact > target_height
+        height = max(1, int(round(target_height if last_unfilled else exact)))
+        available = width - gap * (count - 1)
+        # 取整后的宽度误差补到最后一张上，使整行恰好等于画布宽度
+        widths = [max(1, int(ratios[i] * height)) for i in range(start, end)]
+        if not last_unfilled:
+            widths[-1] = max(1, available - sum(widths[:-1]))
+        # 行高只有几像素时，不足1像素的宽度补成1会使整行超出画布，多出的部分从最宽的图片上减去
+        for _ in range(sum(widths) - available):
+            widest = max(range(count), key=widths.__getitem__)
+            widths[widest] -= 1
+        assert sum(widths) <= available and min(widths) >= 1, '行宽超出画布'
+        x = 0
+        for i, w in zip(range(start, end), widths):
+            boxes[i] = (x, top, w, height)
+            x += w + gap
+        top += height + gap
+    return boxes, max(0, top - gap)
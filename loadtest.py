@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+拼图服务压测
+用若干个并发客户端反复请求 server.py，统计吞吐量、延迟的 p50/p99，
+以及被拒绝(503)和出错的请求数；成功请求的 Server-Timing 按阶段取平均，
+可以看出时间花在排队还是拼接上
+
+示例:
+    python server.py --root origin_pic &
+    python loadtest.py origin_pic --clients 8 --requests 40
+    python loadtest.py origin_pic --upload --endpoint matrix --query "gap=10"
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from main import list_images
+from server import DEFAULT_PORT, CONTENT_TYPES
+
+
+def percentile(values, p):
+    # 最近秩法，values 需已排序
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def multipart_body(paths):
+    # 按上传顺序编码 multipart/form-data 请求体
+    boundary = uuid.uuid4().hex
+    parts = []
+    for path in paths:
+        ext = Path(path).suffix[1:].lower()
+        parts.append((f'--{boundary}\r\n'
+                      f'Content-Disposition: form-data; name="files"; filename="{Path(path).name}"\r\n'
+                      f'Content-Type: {CONTENT_TYPES.get(ext, "application/octet-stream")}\r\n\r\n').encode('utf-8'))
+        parts.append(Path(path).read_bytes())
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('ascii'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def parse_timing(header):
+    # 'queue;dur=12.3, merge;dur=45.6' -> {'queue': 12.3, 'merge': 45.6}（毫秒）
+    timing = {}
+    for item in (header or '').split(','):
+        name, _, rest = item.strip().partition(';')
+        if rest.startswith('dur='):
+            timing[name] = float(rest[4:])
+    return timing
+
+
+def run_client(host, port, target, body, content_type, count):
+    """一个客户端串行发出 count 个请求（复用连接），返回 [(状态码, 秒, 响应字节数, 阶段耗时), ...]"""
+    results = []
+    connection = http.client.HTTPConnection(host, port, timeout=600)
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            connection.request('POST', target, body, {'Content-Type': content_type})
+            response = connection.getresponse()
+            size = 0
+            # 按块读取，与服务端的流式返回对应
+            for chunk in iter(lambda: response.read(1 << 16), b''):
+                size += len(chunk)
+            status = response.status
+            timing = parse_timing(response.getheader('Server-Timing'))
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            status, size, timing = 0, 0, {}
+            connection.close()
+        results.append((status, time.perf_counter() - started, size, timing))
+    connection.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='拼图服务压测')
+    parser.add_argument('folder', help='原图文件夹')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--endpoint', choices=('long', 'matrix'), default='long')
+    parser.add_argument('--query', default='', help='拼接参数，如 "width=800&pages=2"')
+    parser.add_argument('--upload', action='store_true', help='上传图片；不指定则只发送服务器上的文件夹路径')
+    parser.add_argument('--clients', type=int, default=4, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=20, help='总请求数')
+    args = parser.parse_args()
+
+    if args.upload:
+        body, content_type = multipart_body(list_images(args.folder))
+    else:
+        body = json.dumps({'folder': os.path.abspath(args.folder)}).encode('utf-8')
+        content_type = 'application/json'
+    target = f'/{args.endpoint}' + (f'?{args.query}' if args.query else '')
+    counts = [args.requests // args.clients + (i < args.requests % args.clients) for i in range(args.clients)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as executor:
+        futures = [executor.submit(run_client, args.host, args.port, target, body, content_type, n)
+                   for n in counts if n]
+        results = [r for future in futures for r in future.result()]
+    elapsed = time.perf_counter() - started
+
+    statuses = Counter(status for status, _, _, _ in results)
+    ok = [r for r in results if r[0] == 200]
+    latencies = sorted(seconds for _, seconds, _, _ in ok)
+    stages = defaultdict(list)
+    for _, _, _, timing in ok:
+        for name, ms in timing.items():
+            stages[name].append(ms)
+
+    print(f'请求 {len(results)} 个，{args.clients} 个并发客户端，请求体 {len(body) / (1 << 20):.1f}MB，'
+          f'耗时 {elapsed:.2f} 秒')
+    print('状态码：', dict(statuses))
+    print(f'吞吐量：{len(ok) / elapsed:.2f} 个成功请求/秒，'
+          f'{sum(size for _, _, size, _ in ok) / elapsed / (1 << 20):.1f}MB/秒')
+    if latencies:
+        print(f'延迟：p50 {percentile(latencies, 50):.3f} 秒，p99 {percentile(latencies, 99):.3f} 秒，'
+              f'最大 {latencies[-1]:.3f} 秒')
+        print('服务端各阶段平均：', '，'.join(f'{name} {sum(v) / len(v):.0f}ms' for name, v in stages.items()))
+
+
+if __name__ == '__main__':
+    main()
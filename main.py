@@ -1,87 +1,280 @@
 from glob import glob
-from PIL.Image import open, new, Resampling
+from PIL.Image import open, new
 from pathlib import Path
 from re import split
-from os import mkdir, remove
+from os import mkdir, makedirs, remove, environ, cpu_count
 from os.path import exists
 import logging
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from image_worker import save_image, save_bytes, TileLoader
+from tile_cache import TileCache, DEFAULT_CACHE_SIZE, default_cache_dir
+from strip_writer import PngStripWriter, is_streamable, ADAPTIVE_FILTERING
+from array_canvas import DEFAULT_MMAP_THRESHOLD, canvas_bytes
+from image_index import image_info, image_hashes, save_indexes
+from pipeline import PagePipeline
+from profiler import Profiler, NULL_PROFILER
+from manifest import load_manifest, page_record, is_unchanged, mark_written, save_manifest
+from dedupe import dedupe_paths
+from pagination import page_height, plan_pages, page_boxes
+from canvas_mode import BACKGROUNDS, page_mode, tile_convert, reduce_mode
+from size_budget import fit_budget, QUALITY_FORMATS, MAX_WORKERS as BUDGET_WORKERS
+from preview import render_preview, DEFAULT_PREVIEW_SCALE
+from estimate import estimate_resources, choose_engine, describe, refuse_message
+from variants import variant_dir, derive, parse_variant
 
-def merge_image(imgs, format, width, space, out_n, quality, out_path):
+def merge_image(imgs, format, width, space, out_n, quality, out_path,
+                workers=1, reducing_gap=None, streaming=False, max_height=None, max_pixels=None,
+                cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, incremental=True, pipeline_depth=2,
+                loader=None, profiler=NULL_PROFILER, stream_threshold=DEFAULT_MMAP_THRESHOLD,
+                adaptive_mode=True, max_bytes=None, encode_options=None, plan=None, memory_limit=None,
+                variants=(), palette_rms=0):
+    # 按高度均衡分页；max_height/max_pixels 限制单页的最大高度/像素数，放不下时自动增加页数
+    # cache_dir 指定时缓存缩放结果，只改间距、页数、格式、质量时重新运行不必再缩放
+    # incremental 为True时按结果文件夹中的清单只重新生成输入或参数变化了的页面
+    # pipeline_depth 为同时存在的画布数上限，大于1时拼接下一页与编码上一页同时进行
+    # loader 可传入共享的 TileLoader（批量处理多个文件夹时复用进程池），此时忽略 workers 等参数
+    # profiler 为 Profiler 时记录各阶段耗时和计数；使用共享 loader 时以 loader 上的为准
+    # stream_threshold 单页画布超过该字节数时自动按条带流式写出（仅png），为None时不自动切换；
+    # 未安装numpy时流式写出不能自适应滤波，文件明显变大，不自动切换。流式写出的页面
+    # 不能在拼好后再转为灰度或调色板，三通道相同的RGB原图拼出的页面会比内存画布大
+    # adaptive_mode 为True时按页选择画布模式：全是灰度图的页用L画布，
+    # 拼接后颜色不超过256种的页无损转为调色板、三通道相同的页转为灰度
+    # palette_rms 大于0时颜色稍多的页也量化为256色调色板（有损），为允许的各通道均方根误差
+    # max_bytes 指定时每页在该字节预算内搜索最高的压缩质量（quality 作为上限），并报告每页选定的质量
+    # encode_options 为额外的编码参数，如JPEG的 subsampling、WebP的 method
+    # plan 为 plan_layout 对同一组图片和参数的排版结果（例如先生成预览时），不指定则在这里计算
+    # memory_limit 为峰值内存上限（字节）：按预估依次尝试流水线内存画布、单画布、流式写出，
+    # 都超过上限时不执行；不指定时只打印预估
+    # variants 为同一页另外输出的格式（variants.Variant），每页只拼接一次，各格式从同一张画布
+    # 转换、缩小后同时编码，写到结果文件夹下的子文件夹中；流式写出的页面不输出其他格式
     # 检查是否有透明背景的图片
     has_transparency = any(im.mode in ('RGBA', 'LA') for im in imgs)
-    
-    if has_transparency and format.lower() in ['png', 'webp']:
-        color = (255, 255, 255, 0)  # 透明背景
-        mode = "RGBA"
-    else:
-        color = (255, 255, 255)  # 白色背景
-        mode = "RGB"
+    alpha = has_transparency and format.lower() in ['png', 'webp']
+    # 透明背景按整次拼接决定，各页间距的颜色保持一致
+    mode = "RGBA" if alpha else "RGB"
     
     total_num = len(imgs)
-    if total_num % out_n != 0:
-        per_page = round(total_num / (out_n))
+    if total_num == 0 or out_n < 1:
+        print('没有可拼接的图片。')
+        return 0
+    if total_num < out_n:
+        print('图片总数小于输出图片数，每张图片单独成页。')
+
+    # workers 大于1时用进程池并行解码和缩放，粘贴仍按顺序在主进程完成
+    if loader is None:
+        cache = TileCache(cache_dir, cache_size) if cache_dir else None
+        loader_context = TileLoader(workers, reducing_gap, cache, profiler)
     else:
-        per_page = int(total_num / out_n)
+        # 共享的 loader 由调用方负责关闭
+        reducing_gap = loader.reducing_gap
+        profiler = loader.profiler
+        loader_context = nullcontext(loader)
 
-    if per_page < 1:
-        print('图片总数小于输出图片数，不拼图。')
-        return 0
+    if plan is None:
+        plan = plan_layout(imgs, width, space, out_n, max_height, max_pixels, profiler)
+    imgs_size, pages, prefix = plan
+    if len(pages) > out_n:
+        print('受单页尺寸上限限制，输出页数增加为', len(pages))
 
-    imgs_size = [list(im.size) for im in imgs]
-
-    for i in range(len(imgs_size)):
-        rate = width / imgs_size[i][0]
-        imgs_size[i][0] = width
-        imgs_size[i][1] = int(rate * imgs_size[i][1])
-
-    for i in range(1, out_n):
-        sum_height = sum([im[1] + space for im in imgs_size[per_page * (i-1) : per_page * i]]) - space #计算总长度
-        # print(sum_height)
-        if sum_height <= 0:
-            print('仅能拼接', i - 1, '张')
-            return 0
-
-        #新建空白长图
-        result = new(mode, (width, sum_height), color)
-        #拼接单个长图
-        result = merge_single(result,
-                          imgs[per_page * (i - 1) : per_page * i],
-                          imgs_size[per_page * (i - 1) : per_page * i], space) 
-        #存起来
-        if not exists(out_path):
-            mkdir(out_path)
-        file_path = out_path + '/'+ str(i) + '.' + format
-        if exists(file_path):
-            remove(file_path)
-        result.save(file_path, quality = quality) 
-
-    final_sum_height = sum([im[1] + space for im in imgs_size[per_page * (out_n - 1):]]) - space
-    # print(final_sum_height)
-    if final_sum_height <= 0:
-        print('仅能拼接', out_n - 1, '张')
+    # 解码之前按排版结果预估资源，选择放得下的拼接方式
+    budget_copies = 0
+    if max_bytes is not None and format.lower() in QUALITY_FORMATS:
+        budget_copies = min(cpu_count() or 1, BUDGET_WORKERS)
+    # 只有格式支持时才能流式写出，否则各页都会在内存画布上拼接，按内存画布预估
+    streamable = is_streamable(format, mode)
+    if streaming and not streamable:
+        print('该格式不支持流式写出，将在内存中拼接')
+    if streaming and streamable:
+        engines = ('streaming',)
+    else:
+        engines = ('memory', 'memory_single') + (('streaming',) if streamable else ())
+    estimate = estimate_resources([(width, page_height(prefix, s, e, space)) for s, e in pages],
+                                  [im.size for im in imgs], mode, format,
+                                  loader.workers if loader is not None else workers,
+                                  pipeline_depth, engines, [(v.format, v.width) for v in variants],
+                                  budget_copies)
+    engine = choose_engine(estimate, memory_limit)
+    print(describe(estimate, engine if memory_limit is not None else None))
+    if engine is None:
+        print(refuse_message(estimate, memory_limit))
         return 0
-    result = new(mode, (width, final_sum_height), color) #新建空白长图
-    result = merge_single(result,
-                      imgs[per_page * (out_n - 1) : ],
-                      imgs_size[per_page * (out_n - 1) : ], space) #拼接单个长图
-    i = i + 1
-    file_path = out_path + '/'+ str(i) + '.' + format
-    if exists(file_path):
-        remove(file_path)
-    result.save(file_path, quality = quality) #存起来
+    if engine == 'memory_single':
+        pipeline_depth = 1
+    elif engine == 'streaming':
+        streaming = True
+
+    # 影响页面输出的参数，任何一项变化都会使该页重新生成
+    params = {'format': format, 'width': width, 'space': space, 'quality': quality,
+              'mode': mode, 'adaptive_mode': adaptive_mode, 'reducing_gap': reducing_gap,
+              'streaming': streaming, 'stream_threshold': stream_threshold,
+              'max_bytes': max_bytes, 'encode_options': encode_options}
+    if palette_rms:
+        params['palette_rms'] = palette_rms
+    if variants:
+        params['variants'] = [list(v) for v in variants]
+    hashes = image_hashes([im.path for im in imgs]) if incremental else [None] * total_num
+    old_pages = load_manifest(out_path) if incremental else {}
+    records = []
+    skipped = 0
+    page_modes = Counter()
+    page_qualities = {}
+
+    # 其他格式与主格式在线程池中同时编码
+    variant_context = ThreadPoolExecutor(len(variants)) if variants else nullcontext()
+    with loader_context as loader, variant_context as variant_pool, PagePipeline(pipeline_depth) as pipeline:
+        makedirs(out_path, exist_ok=True)
+        for variant in variants:
+            makedirs(out_path + '/' + variant_dir(variant), exist_ok=True)
+        for i, (start, end) in enumerate(pages, start=1):
+            sum_height = page_height(prefix, start, end, space) #计算总长度
+            file_name = str(i) + '.' + format
+            file_path = out_path + '/'+ file_name
+            record = page_record(file_name, [im.path for im in imgs[start:end]], hashes[start:end], params)
+            records.append(record)
+            if incremental and is_unchanged(old_pages, record, out_path):
+                record['output'] = old_pages[file_name]['output']
+                if 'extra' in old_pages[file_name]:
+                    record['extra'] = old_pages[file_name]['extra']
+                record['quality'] = page_qualities[file_name] = old_pages[file_name].get('quality')
+                skipped += 1
+                continue
+            started = time.perf_counter()
+            canvas = page_mode([im.mode for im in imgs[start:end]], alpha) if adaptive_mode else mode
+            color = BACKGROUNDS[canvas]
+            too_large = (stream_threshold is not None and ADAPTIVE_FILTERING
+                         and canvas_bytes(width, sum_height, canvas) > stream_threshold)
+            if (streaming or too_large) and is_streamable(format, canvas):
+                # 流式写出时拼接和编码本来就是交替进行的，不经过流水线
+                save_page(imgs[start:end], imgs_size[start:end],
+                          file_path, width, sum_height, space, canvas, color, loader)
+                mark_written(record, out_path)
+                if variants:
+                    print(f'{file_name} 按条带流式写出，没有完整画布，不输出其他格式')
+                page_modes[canvas] += 1
+                page_qualities[file_name] = None
+                profiler.page(file=file_name, images=end - start, pixels=width * sum_height,
+                              mode=canvas, streaming_seconds=time.perf_counter() - started,
+                              bytes_written=record['output'][1])
+                continue
+            #拼接单个长图
+            with pipeline.compose():
+                result = compose_page(imgs[start:end], imgs_size[start:end],
+                                      width, sum_height, space, canvas, color, loader)
+            compose_seconds = time.perf_counter() - started
+            #存起来：编码和写盘在后台线程进行，同时开始拼接下一页
+            def job(result=result, file_path=file_path, record=record, stem=str(i), page_info=dict(
+                    file=file_name, images=end - start, pixels=width * sum_height,
+                    compose_seconds=compose_seconds)):
+                started = time.perf_counter()
+                # 其他格式从拼好的画布得到，与主格式的编码同时进行
+                extra = [variant_pool.submit(write_variant, result, variant, out_path, stem,
+                                             adaptive_mode, profiler, encode_options, palette_rms)
+                         for variant in variants]
+                if adaptive_mode:
+                    # 无损检查放在后台线程，与下一页的拼接重叠
+                    with profiler.stage('reduce_mode', pixels=page_info['pixels']):
+                        result = reduce_mode(result, format, palette_rms)
+                page_modes[result.mode] += 1
+                chosen = write_page(result, file_path, quality, profiler, max_bytes, encode_options)
+                record['quality'] = page_qualities[page_info['file']] = chosen
+                mark_written(record, out_path, [future.result() for future in extra])
+                profiler.page(encode_write_seconds=time.perf_counter() - started, mode=result.mode,
+                              quality=chosen, bytes_written=record['output'][1], **page_info)
+            pipeline.submit(job)
+    if incremental:
+        save_manifest(out_path, records, old_pages)
+    # 元数据索引在本次拼接中只读写内存，结束时每个文件夹写回一次
+    save_indexes()
 
     print('\n图片总数: ', total_num)
-    print('分割条数: ', out_n)
-    print('每页张数：', per_page)
+    print('分割条数: ', len(pages))
+    print('每页张数：', [end - start for start, end in pages])
+    print('最高一页：', max(page_height(prefix, start, end, space) for start, end in pages))
+    if incremental:
+        print('未变化跳过：', skipped, '页')
+    if page_modes:
+        print('页面模式：', dict(page_modes))
+    if max_bytes is not None:
+        print('每页质量：', [page_qualities.get(record['file']) for record in records])
+        over = [record['file'] for record in records if record['output'][1] > max_bytes]
+        if over:
+            print('超出大小预算：', over)
+    if pipeline.pages:
+        print('流水线：', pipeline.summary())
 
     return 0
 
-def merge_single(result, ims, ims_size, space):
+def plan_layout(imgs, width, space, out_n, max_height=None, max_pixels=None, profiler=NULL_PROFILER):
+    # 一次性计算缩放后的尺寸，按高度均衡分页；尺寸来自元数据索引，不解码图片
+    with profiler.stage('plan', images=len(imgs)):
+        return plan_pages([im.size for im in imgs], width, space, out_n, max_height, max_pixels)
+
+def preview_pages(imgs, plan, width, space, out_path, scale=DEFAULT_PREVIEW_SCALE, loader=None):
+    # 按排版结果快速生成每页的低分辨率预览，保存在结果文件夹下的 preview 文件夹中
+    pages = [(str(i), (width, page_height(plan.prefix, start, end, space)),
+              list(zip([im.path for im in imgs[start:end]], page_boxes(plan, start, end))))
+             for i, (start, end) in enumerate(plan.pages, start=1)]
+    executor = loader.executor if loader is not None else None
+    return render_preview(pages, Path(out_path) / 'preview', scale, executor)
+
+def save_page(ims, ims_size, file_path, width, height, space, mode, color, loader=None):
+    # 按条带边拼边编码并保存单个长图，整张画布不会出现在内存中；调用前需确认 is_streamable
+    if exists(file_path):
+        remove(file_path)
+    with PngStripWriter(file_path, width, height, mode) as writer:
+        stream_single(writer, ims, ims_size, space, color, loader)
+
+def compose_page(ims, ims_size, width, height, space, mode, color, loader=None):
+    #新建空白长图
+    result = new(mode, (width, height), color)
+    #拼接单个长图
+    return merge_single(result, ims, ims_size, space, loader)
+
+def write_page(result, file_path, quality, profiler=NULL_PROFILER, max_bytes=None, options=None):
+    # 编码并保存一页，返回实际使用的质量
+    # 指定 max_bytes 时在内存中并行试编码，选出不超过预算的最高质量后再写盘
+    options = options or {}
+    if exists(file_path):
+        remove(file_path)
+    if max_bytes is None:
+        save_image(result, file_path, profiler, quality = quality, **options)
+        return quality
+    with profiler.stage('encode', pixels=result.size[0] * result.size[1]):
+        data, quality = fit_budget(result, Path(file_path).suffix[1:], max_bytes, quality, **options)
+    save_bytes(data, file_path, profiler)
+    return quality
+
+def write_variant(canvas, variant, out_path, stem, adaptive_mode=True, profiler=NULL_PROFILER, options=None,
+                  palette_rms=0):
+    # 把拼好的一页按另一种格式转换、缩小后保存，返回相对结果文件夹的文件名
+    name = variant_dir(variant) + '/' + stem + '.' + variant.format
+    with profiler.stage('variant', pixels=canvas.size[0] * canvas.size[1]):
+        image = derive(canvas, variant, adaptive_mode, palette_rms)
+    write_page(image, out_path + '/' + name, variant.quality, profiler, None, options)
+    return name
+
+def stream_single(writer, ims, ims_size, space, color, loader=None):
+    # 流式拼接单个长图：每张图片作为一个条带写出，图片之间写入间距行
+    loader = loader or TileLoader()
+    tiles = loader.tiles([im.path for im in ims], ims_size, tile_convert(writer.mode))  # 等比缩放
+    for i, mew_im in enumerate(tiles):
+        if i > 0:
+            writer.write_fill(space, color)
+        writer.write(mew_im)
+
+def merge_single(result, ims, ims_size, space, loader=None):
     # 拼接单个长图
+    # 每张图片在粘贴前才解码，粘贴后立即释放，内存只与当前页有关
+    # 解码缩放的并行、快速缩放、缓存等设置由 loader (TileLoader) 决定
+    loader = loader or TileLoader()
     top = 0
-    for i, im in enumerate(ims):
-        mew_im = im.resize(ims_size[i], Resampling.LANCZOS)  # 等比缩放
-        result.paste(mew_im, box=(0, top))
+    tiles = loader.tiles([im.path for im in ims], ims_size, tile_convert(result.mode))  # 等比缩放
+    for i, mew_im in enumerate(tiles):
+        with loader.profiler.stage('paste', pixels=ims_size[i][0] * ims_size[i][1]):
+            result.paste(mew_im, box=(0, top))
         top += ims_size[i][1] + space
     return (result)
 
@@ -91,20 +284,21 @@ def sorted_alphanumeric(data):
     alphanum_key = lambda key: [convert(c) for c in split('([0-9]+)', key)]
     return sorted(data, key=alphanum_key)
 
-# 获取当前文件夹下图片列表
+# 默认的原图和结果文件夹都在脚本所在目录下
 current_dir = Path(__file__).parent
 origin_pic_dir = current_dir / 'origin_pic'
 
-logging.info(origin_pic_dir)
+# 支持的图片格式
+image_patterns = ('*.png', '*.jpg', '*.jpeg', '*.bmp', '*.jiff')
 
-if not exists(origin_pic_dir):
-    mkdir(origin_pic_dir)
-
-image_files = glob(str(origin_pic_dir / '*.png')) + \
-              glob(str(origin_pic_dir / '*.jpg')) + \
-              glob(str(origin_pic_dir / '*.jpeg')) + \
-              glob(str(origin_pic_dir / '*.bmp')) + \
-              glob(str(origin_pic_dir / '*.jiff')) 
+# 获取文件夹下图片列表，按文件名中的数字自然排序
+def list_images(directory):
+    directory = Path(directory)
+    logging.info(directory)
+    files = []
+    for pattern in image_patterns:
+        files += glob(str(directory / pattern))
+    return sorted_alphanumeric(files)
 
 # def get_image_files(directory: Path):
 #     # 定义图片格式
@@ -120,15 +314,26 @@ image_files = glob(str(origin_pic_dir / '*.png')) + \
 #     return image_files
 
 
-def read_pic():
-    ims = [open(fn) for fn in (image_files)]
-    # 对于PNG等可能包含透明通道的图片，保持其原始格式
-    for i, im in enumerate(ims):
-        # 如果图片是包含透明通道的RGBA/LA（灰度图）模式，保持原样
-        # 如果是其他模式且不包含透明通道，转换为RGB
-        if im.mode not in ('RGBA', 'LA'):
-            ims[i] = ims[i].convert("RGB")
-    return (ims)
+class LazyImage:
+    # 延迟加载的图片：构造时只读取文件头获取尺寸和模式（已知时直接使用索引中的值），
+    # 像素在拼接该页时才由 TileLoader 解码
+    def __init__(self, path, size=None, mode=None):
+        self.path = path
+        if size is None or mode is None:
+            with open(path) as im:
+                size, mode = im.size, im.mode
+        self.size = tuple(size)
+        self.mode = mode
+
+
+def read_pic(image_files=None):
+    # 尺寸和模式来自元数据索引，只有新增或改动的文件才会读取文件头，不解码像素
+    # 不指定 image_files 时读取默认原图文件夹
+    if image_files is None:
+        image_files = list_images(origin_pic_dir)
+    infos = image_info(image_files)
+    return [LazyImage(fn, (info['width'], info['height']), info['mode'])
+            for fn, info in zip(image_files, infos)]
 
 def is_customized(args):
     while True:
@@ -144,13 +349,23 @@ def is_customized(args):
 # 主函数运行
 def main():
     
+    if not exists(origin_pic_dir):
+        mkdir(origin_pic_dir)
+
     # 各参数默认值
     format = 'png'
     width = 800
     space = 10
     pages = 9
     quality = 80
+    max_bytes = None
+    variants = []
+    workers = 1
+    reducing_gap = None
+    max_height = None
+    dedupe = False
     out_path = str(current_dir / 'result_pic')
+    cache_dir = default_cache_dir()
     
     # 添加用户是否开启自定义设置功能    
     config_open =  is_customized('是否要自定义设置相关参数？(y/n): ')
@@ -183,6 +398,13 @@ def main():
             except ValueError:
                 print("未输入有效数字，将使用默认值9")
 
+        user_input = input('单页最大高度(像素)，不输则不限制：').strip()
+        if user_input:
+            try: 
+                max_height = int(user_input)
+            except ValueError:
+                print("未输入有效数字，将不限制单页高度")
+
         user_input = input('压缩质量0-100，不输默认80，数字越大质量越高：').strip()
         if user_input:
             try: 
@@ -190,6 +412,36 @@ def main():
             except ValueError:
                 print("未输入有效数字，将使用默认值80")
 
+        user_input = input('单页大小上限(KB)，不输则不限制，指定时自动降低质量以满足上限：').strip()
+        if user_input:
+            try: 
+                max_bytes = int(float(user_input) * 1024)
+            except ValueError:
+                print("未输入有效数字，将不限制单页大小")
+
+        user_input = input('同时输出的其他格式，空格分隔，如 webp:80 jpg:85:1080（格式:质量:宽度），不输则不输出：').strip()
+        for spec in user_input.split():
+            try:
+                variants.append(parse_variant(spec, quality))
+            except ValueError:
+                print(f"无效的格式 {spec}，将忽略")
+
+        user_input = input('并行处理的进程数，不输默认1（不并行）：').strip()
+        if user_input:
+            try: 
+                workers = int(user_input)
+            except ValueError:
+                print("未输入有效数字，将使用默认值1")
+
+        user_input = input('快速缩放容差(如2或3，越大越精确)，不输则精确缩放：').strip()
+        if user_input:
+            try: 
+                reducing_gap = float(user_input)
+            except ValueError:
+                print("未输入有效数字，将使用精确缩放")
+
+        dedupe = is_customized('是否去除近似重复的图片？(y/n): ')
+
         user_input = input('输出文件夹，不输默认在当前目录下新建结果文件夹:').strip()
         if user_input:
             out_path = user_input
@@ -198,12 +450,32 @@ def main():
     print('图片宽: ', width)
     print('图片间距: ', space)
     print('共输出' + str(pages) + '张图')
+    print('单页最大高度', '不限制' if max_height is None else max_height)
     print('压缩质量', quality)
+    print('单页大小上限', '不限制' if max_bytes is None else f'{max_bytes // 1024}KB')
+    print('其他格式', ' '.join(variant_dir(v) for v in variants) or '无')
+    print('并行进程数', workers)
+    print('快速缩放容差', '精确缩放' if reducing_gap is None else reducing_gap)
+    print('去除近似重复', '是' if dedupe else '否')
     print('生成结果目录', out_path)
+    print('缩放缓存目录', cache_dir)
+
+    # 设置环境变量 LONG_PIC_PROFILE=报告路径.json 时输出分阶段性能统计
+    profile_path = environ.get('LONG_PIC_PROFILE')
+    profiler = Profiler() if profile_path else NULL_PROFILER
 
     try:
-        merge_image(read_pic(), format, width, space, pages, quality, out_path)
+        image_files = list_images(origin_pic_dir)
+        if dedupe:
+            image_files = dedupe_paths(image_files)
+        merge_image(read_pic(image_files), format, width, space, pages, quality, out_path, workers, reducing_gap,
+                    max_height=max_height, cache_dir=cache_dir, profiler=profiler, max_bytes=max_bytes,
+                    variants=variants)
         print('拼图完成\n')
+        if profiler.enabled:
+            print(profiler.summary())
+            profiler.save(profile_path)
+            print('性能统计已保存至', profile_path)
     except Exception as e:
         # 处理所有异常
         print(f"发生了异常: {e}")
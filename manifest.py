@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+输出清单
+在结果文件夹中记录每一页由哪些图片（及其内容哈希）、用什么参数生成。
+重新运行时只重新拼接和编码输入或参数发生变化的页面，其余页面原样保留
+"""
+
+import json
+import os
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def load_manifest(out_path):
+    # 读取上一次运行的清单，返回 {文件名: 页面记录}
+    try:
+        with open(os.path.join(out_path, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    return {page['file']: page for page in data.get('pages', [])}
+
+
+def page_record(file_name, paths, hashes, params):
+    """
+    生成一页的记录
+
+    参数:
+        file_name: 输出文件名
+        paths: 该页的图片路径
+        hashes: 与 paths 对应的内容哈希
+        params: 影响该页输出结果的全部参数（可JSON序列化）
+    """
+    return {
+        'file': file_name,
+        'inputs': [[os.path.abspath(p), h] for p, h in zip(paths, hashes)],
+        'params': params,
+    }
+
+
+def _output_stat(file_path):
+    st = os.stat(file_path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def is_unchanged(old_pages, record, out_path):
+    """输入内容、参数与上次相同且输出文件未被改动时返回True"""
+    old = old_pages.get(record['file'])
+    if old is None or old['params'] != record['params']:
+        return False
+    # 只比较内容哈希，图片改名或移动后内容不变的页面不必重新生成
+    hashes = [h for _, h in record['inputs']]
+    if None in hashes or [h for _, h in old['inputs']] != hashes:
+        return False
+    try:
+        if old.get('output') != _output_stat(os.path.join(out_path, record['file'])):
+            return False
+        # 同一页的其他格式也都要在且未被改动
+        return all(stat == _output_stat(os.path.join(out_path, name))
+                   for name, stat in old.get('extra', {}).items())
+    except OSError:
+        return False
+
+
+def mark_written(record, out_path, extra=()):
+    # 页面写出后记录输出文件的状态，用于下次判断文件是否被外部改动
+    # extra 为同一页其他格式的文件名（相对结果文件夹）
+    record['output'] = _output_stat(os.path.join(out_path, record['file']))
+    if extra:
+        record['extra'] = {name: _output_stat(os.path.join(out_path, name)) for name in extra}
+
+
+def _output_files(pages):
+    # 清单中所有页面的全部输出文件
+    names = set()
+    for page in pages:
+        names.add(page['file'])
+        names.update(page.get('extra', {}))
+    return names
+
+
+def save_manifest(out_path, records, old_pages=None):
+    """
+    保存本次运行的清单，并删除上次生成、但本次不再输出的页面文件
+
+    参数:
+        records: 本次所有页面的记录
+        old_pages: load_manifest 读到的上次清单
+    """
+    current = _output_files(records)
+    for name in _output_files((old_pages or {}).values()) - current:
+        try:
+            os.remove(os.path.join(out_path, name))
+        except OSError:
+            pass
+    tmp_path = os.path.join(out_path, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'pages': records}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(out_path, MANIFEST_NAME))
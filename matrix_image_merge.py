@@ -8,8 +8,19 @@
 
 import os
 import math
+from collections import namedtuple
+from contextlib import nullcontext
 from pathlib import Path
 from PIL import Image
+from image_worker import TileLoader, save_image
+from profiler import Profiler, NULL_PROFILER
+from tile_cache import TileCache, DEFAULT_CACHE_SIZE, default_cache_dir
+from image_index import image_info, save_indexes
+from justified_layout import layout_rows
+from array_canvas import GridCanvas, HAS_NUMPY, DEFAULT_MMAP_THRESHOLD, canvas_bytes
+from preview import render_preview, DEFAULT_PREVIEW_SCALE
+from main import sorted_alphanumeric
+from estimate import estimate_resources, choose_engine, describe, refuse_message
 
 # 计算最优的行列数
 def calculate_grid(number, n=None, m=None): 
@@ -34,7 +45,85 @@ gap_default = 0
 # 缩放倍数
 scale_default = 1
 
-def merge_images(image_paths, output_path, rows=None, cols=None, gap=gap_default, width=None, height=None):
+# 排版结果：行列数、单元格尺寸（等高行排版时为目标行高）、画布尺寸、每张图片的 (x, y, 宽, 高)
+MatrixPlan = namedtuple('MatrixPlan', 'layout rows cols width height canvas_width canvas_height boxes')
+
+def plan_matrix(image_paths, rows=None, cols=None, gap=gap_default, width=None, height=None, layout='grid'):
+    """
+    计算矩阵拼接的排版，只读取元数据索引，不解码图片
+    
+    参数与 merge_images 的同名参数相同；返回 MatrixPlan，可以传给 merge_images 和 preview_matrix
+    """
+    number = len(image_paths)
+    
+    # 自动计算行列数
+    rows, cols = calculate_grid(number, rows, cols)
+    
+    # 从元数据索引获取第一张图片的尺寸信息，不必打开图片
+    info = image_info(image_paths[:1])[0]
+    img_width, img_height = info['width'], info['height']
+    aspect_ratio = img_height / img_width
+    # 如果只指定了宽度，按比例计算高度
+    if width and not height:
+        height = int(width * aspect_ratio)
+    # 如果只指定了高度，按比例计算宽度
+    elif height and not width:
+        width = int(height / aspect_ratio)
+    # 如果都没有指定，则使用缩放倍数
+    elif width is None and height is None:
+        width = int(img_width * scale_default)
+        height = int(img_height * scale_default)
+    
+    # 让首行图片为较小的数量（余数）
+    first_row_imgs = number - (rows - 1) * cols
+    # 分别计算整体宽度和首行宽度 让首行居中显示
+    merged_width = (cols * width) + ((cols - 1) * gap)
+    first_merged_width = (first_row_imgs * width) + ((first_row_imgs - 1) * gap)
+    # 计算首行居中显示需要偏移的距离
+    offset = math.floor((merged_width - first_merged_width) / 2)
+    # 计算整体高度
+    merged_height = (rows * height) + ((rows - 1) * gap)
+    
+    if layout == 'justified':
+        sizes = [(info['width'], info['height']) for info in image_info(image_paths)]
+        boxes, canvas_height = layout_rows(sizes, merged_width, height, gap)
+        return MatrixPlan(layout, rows, cols, width, height, merged_width, canvas_height, boxes)
+    
+    boxes = []
+    for current_img in range(min(number, rows * cols)):
+        row, col = divmod(current_img, cols)
+        # 计算粘贴位置
+        x = col * (width + gap)
+        y = row * (height + gap)
+
+        # # 计算首行偏移
+        # if row == 0 and offset > 0:
+        #     x += offset
+        boxes.append((x, y, width, height))
+    return MatrixPlan(layout, rows, cols, width, height, merged_width, merged_height, boxes)
+
+def readable_sizes(image_paths):
+    # 能读取文件头的原图尺寸，只用于预估；读不出的图片留给拼接时逐张报错跳过
+    sizes = []
+    for path in image_paths:
+        try:
+            info = image_info([path])[0]
+        except (OSError, SyntaxError, ValueError):
+            continue
+        sizes.append((info['width'], info['height']))
+    return sizes
+
+def preview_matrix(image_paths, plan, output_path, scale=DEFAULT_PREVIEW_SCALE, loader=None):
+    """按排版结果快速生成低分辨率预览，保存在输出文件所在文件夹下的 preview 文件夹中"""
+    pages = [(Path(output_path).stem, (plan.canvas_width, plan.canvas_height),
+              list(zip(image_paths, plan.boxes)))]
+    executor = loader.executor if loader is not None else None
+    return render_preview(pages, Path(output_path).parent / 'preview', scale, executor)
+
+def merge_images(image_paths, output_path, rows=None, cols=None, gap=gap_default, width=None, height=None, workers=1, reducing_gap=None,
+                 cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, loader=None, profiler=NULL_PROFILER,
+                 compositor='paste', mmap_threshold=DEFAULT_MMAP_THRESHOLD, mmap_dir=None, layout='grid',
+                 plan=None, memory_limit=None):
     """
     将多张图片按矩阵形式合并
     
@@ -46,80 +135,159 @@ def merge_images(image_paths, output_path, rows=None, cols=None, gap=gap_default
         gap: 图片间的间隔像素
         width: 每张图片调整后的宽度，不指定则使用原图宽度
         height: 每张图片调整后的高度，不指定则使用原图高度
+        workers: 并行解码缩放的进程数，1为串行
+        reducing_gap: 快速缩放容差，不指定则完整解码后精确缩放
+        cache_dir: 缩放结果缓存目录，不指定则不缓存
+        cache_size: 缩放结果缓存的大小上限（字节）
+        loader: 共享的 TileLoader，指定时忽略 workers、reducing_gap 和缓存参数，由调用方负责关闭
+        profiler: Profiler 性能统计，不指定则不统计；使用共享 loader 时以 loader 上的为准
+        compositor: 'paste' 逐张用 PIL 粘贴；'numpy' 写入 NumPy 网格数组（需要安装numpy）
+        mmap_threshold: 画布超过该字节数且输出为png时，画布放在磁盘上的内存映射文件中，
+            按条带编码输出，画布大小只受磁盘空间限制；为None时不启用
+        mmap_dir: 内存映射文件所在目录，不指定则使用系统临时目录
+        layout: 'grid' 所有图片缩放到相同尺寸排成网格；
+            'justified' 等高行排版，每行图片保持原比例缩放到同一高度并恰好填满整行，
+            此时 cols 和 width 决定画布宽度，height 为目标行高
+        plan: plan_matrix 对同一组图片和参数的排版结果（例如先生成预览时），
+            指定时忽略 rows、cols、width、height、layout
+        memory_limit: 峰值内存上限（字节）：内存画布超过上限时改用磁盘画布（需要numpy、输出png），
+            仍然超过则不执行；不指定时只打印预估
     """
     number = len(image_paths)
     if number == 0:
         print("请检查原始图片路径")
         return
     
-    # 自动计算行列数
-    rows, cols = calculate_grid(number, rows, cols)
+    # 解码和缩放可以并行，粘贴按顺序在主进程完成
+    if loader is None:
+        cache = TileCache(cache_dir, cache_size) if cache_dir else None
+        loader_context = TileLoader(workers, reducing_gap, cache, profiler)
+    else:
+        profiler = loader.profiler
+        loader_context = nullcontext(loader)
     
-    # 打开第一张图片来获取相关尺寸信息
-    with open(image_paths[0], 'rb') as f:
-        img_width, img_height = Image.open(f).size
-        aspect_ratio = img_height / img_width
-        # 如果只指定了宽度，按比例计算高度
-        if width and not height:
-            height = int(width * aspect_ratio)
-        # 如果只指定了高度，按比例计算宽度
-        elif height and not width:
-            width = int(height / aspect_ratio)
-        # 如果都没有指定，则使用缩放倍数
-        elif width is None and height is None:
-            width = int(img_width * scale_default)
-            height = int(img_height * scale_default)
-            
-        
+    if plan is None:
+        with profiler.stage('plan', images=number):
+            plan = plan_matrix(image_paths, rows, cols, gap, width, height, layout)
+    layout, rows, cols, width, height = plan.layout, plan.rows, plan.cols, plan.width, plan.height
+    merged_width, merged_height = plan.canvas_width, plan.canvas_height
     
-    # 让首行图片为较小的数量（余数）
-    first_row_imgs = number - (rows - 1) * cols
-    # 分别计算整体宽度和首行宽度 让首行居中显示
-    merged_width = (cols * width) + ((cols - 1) * gap)
-    first_merged_width = (first_row_imgs * width) + ((first_row_imgs - 1) * gap)
-    # 计算首行居中显示需要偏移的距离
-    offset = math.floor((merged_width - first_merged_width) / 2)
-    # 计算整体高度
-    merged_height = (rows * height) + ((rows - 1) * gap)
+    # 解码之前按排版结果预估资源；网格排版在内存放不下时可以改用磁盘画布
+    can_mmap = layout == 'grid' and HAS_NUMPY and output_path.lower().endswith('.png')
+    estimate = estimate_resources([(merged_width, merged_height)], readable_sizes(image_paths),
+                                  'RGB', Path(output_path).suffix[1:] or 'png',
+                                  loader.workers if loader is not None else workers,
+                                  engines=('memory', 'mmap') if can_mmap else ('memory',))
+    engine = choose_engine(estimate, memory_limit)
+    print(describe(estimate, engine if memory_limit is not None else None))
+    if engine is None:
+        print(refuse_message(estimate, memory_limit))
+        return
     
-    # 创建新图像 
-    merged_image = Image.new('RGB', (merged_width, merged_height), (255, 255, 255))
+    if layout == 'justified':
+        with loader_context as loader:
+            merge_justified(image_paths, output_path, merged_width, height, gap, loader, plan.boxes)
+        save_indexes()
+        return
     
-    # 将图片粘贴到新图像上
-    current_img = 0
-    for row in range(rows):
-        # if row == 0:
-        #     col_range = first_row_imgs
-        # else:
-        col_range = cols
-        for col in range(col_range):
-            if current_img < number:
-                try:
-                    img = Image.open(image_paths[current_img])
-                    # 调整图片大小
-                    img = img.resize((width, height), Image.LANCZOS)
-                    
-                    # 计算粘贴位置
-                    x = col * (width + gap)
-                    y = row * (height + gap)
-                    
-                    # # 计算首行偏移
-                    # if row == 0 and offset > 0:
-                    #     x += offset
+    # 画布过大且输出为png时，把画布放在磁盘上的内存映射文件中
+    use_mmap = engine == 'mmap' or (mmap_threshold is not None
+                                    and canvas_bytes(merged_width, merged_height) > mmap_threshold)
+    if use_mmap and not (HAS_NUMPY and output_path.lower().endswith('.png')):
+        print("画布超过内存映射阈值，但只有安装numpy且输出png时才能使用磁盘画布，将在内存中拼接")
+        use_mmap = False
+    if use_mmap:
+        print(f"画布 {merged_width}×{merged_height} 较大，使用磁盘上的内存映射画布")
+        compositor = 'numpy'
+    if compositor == 'numpy' and not HAS_NUMPY:
+        print("未安装numpy，改用逐张粘贴")
+        compositor = 'paste'
+    
+    # 创建新图像；磁盘画布在 with 结束时关闭映射并删除临时文件
+    if use_mmap:
+        canvas_context = GridCanvas.mapped(rows, cols, width, height, gap, folder=mmap_dir)
+    elif compositor == 'numpy':
+        canvas_context = GridCanvas(rows, cols, width, height, gap)
+    else:
+        canvas_context = nullcontext()
+    with loader_context as loader, canvas_context as grid:
+        if compositor != 'numpy':
+            merged_image = Image.new('RGB', (merged_width, merged_height), (255, 255, 255))
 
-                    # 粘贴图片
-                    merged_image.paste(img, (x, y))
-                    current_img += 1
-                except Exception as e:
-                    print(f"处理图片 {image_paths[current_img]} 时出错: {e}")
-                    current_img += 1
-            else:
-                break
+        count = min(number, rows * cols)
+        tiles = loader.tiles(image_paths[:count], [(width, height)] * count,
+                             convert=False, return_errors=True)
+        for current_img, img in enumerate(tiles):
+            if isinstance(img, Exception):
+                print(f"处理图片 {image_paths[current_img]} 时出错: {img}")
+                continue
+            if compositor == 'numpy':
+                with profiler.stage('paste', pixels=width * height):
+                    grid.put(current_img, img)
+                continue
+            x, y, _, _ = plan.boxes[current_img]
+
+            # 粘贴图片
+            with profiler.stage('paste', pixels=width * height):
+                merged_image.paste(img, (x, y))
     
-    # 保存结果
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    merged_image.save(output_path)
+        # 保存结果
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if use_mmap:
+            # 按条带从磁盘画布编码，整张画布不会进入内存
+            with profiler.stage('encode', pixels=merged_width * merged_height):
+                grid.save_png(output_path)
+        else:
+            if compositor == 'numpy':
+                with profiler.stage('convert', pixels=merged_width * merged_height):
+                    merged_image = grid.to_image()
+            save_image(merged_image, output_path, profiler)
+    profiler.page(file=output_path, images=number, pixels=merged_width * merged_height,
+                  bytes_written=os.path.getsize(output_path))
     print(f"已将 {number} 张图片合并为 {rows}×{cols} 的矩阵图片，保存至 {output_path}")
+    save_indexes()
+
+def merge_justified(image_paths, output_path, canvas_width, row_height, gap=gap_default, loader=None, boxes=None):
+    """
+    等高行排版：每行图片缩放到同一高度并恰好填满画布宽度，图片不变形
+    
+    参数:
+        image_paths: 图片路径列表
+        output_path: 输出路径
+        canvas_width: 画布宽度
+        row_height: 目标行高，实际行高会在其上下浮动
+        gap: 图片间的间隔像素
+        loader: TileLoader，不指定则串行处理
+        boxes: 已经算好的排版（plan_matrix 的结果），不指定则在这里计算
+    """
+    loader = loader or TileLoader()
+    profiler = loader.profiler
+    if boxes is None:
+        with profiler.stage('plan', images=len(image_paths)):
+            sizes = [(info['width'], info['height']) for info in image_info(image_paths)]
+            boxes, canvas_height = layout_rows(sizes, canvas_width, row_height, gap)
+    else:
+        canvas_height = max(y + h for _, y, _, h in boxes)
+    
+    merged_image = Image.new('RGB', (canvas_width, canvas_height), (255, 255, 255))
+    tiles = loader.tiles(image_paths, [(w, h) for _, _, w, h in boxes],
+                         convert=False, return_errors=True)
+    for current_img, img in enumerate(tiles):
+        if isinstance(img, Exception):
+            print(f"处理图片 {image_paths[current_img]} 时出错: {img}")
+            continue
+        x, y, w, h = boxes[current_img]
+        with profiler.stage('paste', pixels=w * h):
+            merged_image.paste(img, (x, y))
+    
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    save_image(merged_image, output_path, profiler)
+    used = sum(w * h for _, _, w, h in boxes)
+    total = canvas_width * canvas_height
+    profiler.page(file=output_path, images=len(image_paths), pixels=total,
+                  bytes_written=os.path.getsize(output_path))
+    print(f"已将 {len(image_paths)} 张图片按等高行排版合并为 {canvas_width}×{canvas_height} 的图片，"
+          f"留白 {(total - used) / total:.1%}，保存至 {output_path}")
 
 def main():
     # 获取当前目录
@@ -144,8 +312,8 @@ def main():
             if file.lower().endswith(image_types):
                 image_paths.append(str(current_dir / file))
     
-    # 按文件名排序
-    image_paths.sort(key=lambda x: int(Path(x).stem))
+    # 按文件名自然排序（与长图拼接、rename.py 一致），文件名不必是纯数字
+    image_paths = sorted_alphanumeric(image_paths)
     
     if not image_paths:
         print("未找到图片文件")
@@ -223,6 +391,17 @@ def main():
             except ValueError:
                 print("输入无效，将按原比例自动计算")
         
+        workers_input = input("请输入并行处理的进程数(默认1，不并行): ").strip()
+        workers = 1
+        if workers_input:
+            try:
+                workers = int(workers_input)
+                if workers <= 0:
+                    print("进程数必须为正整数，将使用默认值1")
+                    workers = 1
+            except ValueError:
+                print("输入无效，将使用默认值1")
+        
         output_name = input("请输入输出文件名(默认'merged.png'): ").strip()
         if not output_name:
             output_name = 'merged.png'
@@ -236,6 +415,7 @@ def main():
         gap = 0
         width = None
         height = None
+        workers = 1
         output_path = str(output_dir / 'merged.png')
     
     print("\n使用的参数:")
@@ -244,10 +424,21 @@ def main():
     print(f"间隔: {gap}像素")
     print(f"图片宽度: {'原图宽度' if width is None else width}")
     print(f"图片高度: {'按比例计算' if height is None else height}")
+    print(f"并行进程数: {workers}")
     print(f"输出路径: {output_path}")
+    print(f"缩放缓存目录: {default_cache_dir()}")
+    
+    # 设置环境变量 LONG_PIC_PROFILE=报告路径.json 时输出分阶段性能统计
+    profile_path = os.environ.get('LONG_PIC_PROFILE')
+    profiler = Profiler() if profile_path else NULL_PROFILER
     
     # 执行合并
-    merge_images(image_paths, output_path, rows, cols, gap, width, height)
+    merge_images(image_paths, output_path, rows, cols, gap, width, height, workers,
+                 cache_dir=default_cache_dir(), profiler=profiler)
+    if profiler.enabled:
+        print(profiler.summary())
+        profiler.save(profile_path)
+        print(f"性能统计已保存至 {profile_path}")
 
 if __name__ == '__main__':
     try:
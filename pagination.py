@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+长图分页
+先一次性计算所有图片缩放后的高度和前缀和，再按高度均衡地切分页面：
+二分最高一页的高度，用前缀和+二分查找贪心验证，使最高的一页尽量矮
+"""
+
+from bisect import bisect_right
+from collections import namedtuple
+
+
+def scaled_sizes(sizes, width):
+    # 按统一宽度等比缩放后的尺寸
+    return [(width, int(width / w * h)) for w, h in sizes]
+
+
+def prefix_sums(heights, space):
+    """
+    前缀和 prefix[i] = 前 i 张图片的 (高度 + 间距) 之和
+    第 a 到 b-1 张组成一页时页高为 prefix[b] - prefix[a] - space
+    """
+    prefix = [0]
+    for h in heights:
+        prefix.append(prefix[-1] + h + space)
+    return prefix
+
+
+def page_height(prefix, start, end, space):
+    # 第 start 到 end-1 张图片拼成一页的高度
+    return prefix[end] - prefix[start] - space
+
+
+def _greedy_pages(prefix, space, limit):
+    # 每页尽量多放图片且页高不超过 limit，返回各页的 (start, end)
+    # 单张图片本身超过 limit 时独占一页
+    n = len(prefix) - 1
+    pages = []
+    start = 0
+    while start < n:
+        end = bisect_right(prefix, prefix[start] + limit + space) - 1
+        end = max(end, start + 1)
+        pages.append((start, end))
+        start = end
+    return pages
+
+
+def _split_to(pages, prefix, space, count):
+    # 页数不足 count 时，反复把最高的一页拆成两页（不会使最高页变高）
+    pages = list(pages)
+    while len(pages) < count:
+        splittable = [p for p in pages if p[1] - p[0] > 1]
+        if not splittable:
+            break
+        start, end = max(splittable, key=lambda p: page_height(prefix, p[0], p[1], space))
+        # 在尽量平分高度的位置拆开
+        middle = (prefix[start] + prefix[end]) / 2
+        cut = min(max(bisect_right(prefix, middle, start, end), start + 1), end - 1)
+        index = pages.index((start, end))
+        pages[index:index + 1] = [(start, cut), (cut, end)]
+    return pages
+
+
+def balanced_pages(heights, space, out_n):
+    """
+    把图片按顺序分成 out_n 页（图片少于 out_n 张时每张一页），使最高的一页尽量矮
+
+    参数:
+        heights: 每张图片缩放后的高度
+        space: 图片间距
+        out_n: 页数
+    返回:
+        各页的 (start, end) 下标区间列表
+    """
+    if not heights or out_n < 1:
+        return []
+    prefix = prefix_sums(heights, space)
+    low = max(heights)
+    high = page_height(prefix, 0, len(heights), space)
+    # 二分最高页的高度：贪心分页的页数随 limit 增大单调不增
+    while low < high:
+        limit = (low + high) // 2
+        if len(_greedy_pages(prefix, space, limit)) <= out_n:
+            high = limit
+        else:
+            low = limit + 1
+    pages = _greedy_pages(prefix, space, low)
+    return _split_to(pages, prefix, space, min(out_n, len(heights)))
+
+
+def paginate(heights, space, out_n, width=None, max_height=None, max_pixels=None):
+    """
+    均衡分页，可以额外限制每页的最大高度或最大像素数
+
+    参数:
+        max_height: 每页最大高度，不指定则不限制
+        max_pixels: 每页最大像素数（宽×高），需要同时给出 width
+    返回:
+        各页的 (start, end) 下标区间列表；out_n 页放不下时会增加页数
+    """
+    limit = None
+    if max_height:
+        limit = max_height
+    if max_pixels and width:
+        pixel_limit = max_pixels // width
+        limit = pixel_limit if limit is None else min(limit, pixel_limit)
+
+    pages = balanced_pages(heights, space, out_n)
+    if limit is None:
+        return pages
+    prefix = prefix_sums(heights, space)
+    if all(page_height(prefix, s, e, space) <= limit for s, e in pages):
+        return pages
+    # 贪心得到满足上限所需的最少页数，再在该页数下重新均衡
+    return balanced_pages(heights, space, len(_greedy_pages(prefix, space, limit)))
+
+
+# 一次排版的结果：缩放后的尺寸、各页 (start, end)、高度前缀和
+PagePlan = namedtuple('PagePlan', 'sizes pages prefix')
+
+
+def plan_pages(sizes, width, space, out_n, max_height=None, max_pixels=None):
+    """按统一宽度缩放并分页，预览和正式拼接共用同一个结果，不必重复计算"""
+    scaled = scaled_sizes(sizes, width)
+    heights = [h for _, h in scaled]
+    pages = paginate(heights, space, out_n, width, max_height, max_pixels)
+    return PagePlan(scaled, pages, prefix_sums(heights, space))
+
+
+def page_boxes(plan, start, end):
+    # 第 start 到 end-1 张图片在所在页中的 (x, y, 宽, 高)，前缀和中已经包含了间距
+    top = plan.prefix[start]
+    return [(0, plan.prefix[i] - top, w, h)
+            for i, (w, h) in zip(range(start, end), plan.sizes[start:end])]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+拼接/编码流水线
+主线程拼接第 N+1 页的同时，后台线程对第 N 页编码并写盘（PIL编码时会释放GIL）。
+同时存在的画布数量不超过 depth，避免拼接速度快于编码时内存无限增长
+"""
+
+import threading
+import queue
+import time
+from contextlib import contextmanager
+
+
+class PagePipeline:
+    """
+    用法:
+        with PagePipeline(depth=2) as pipeline:
+            for page in pages:
+                with pipeline.compose():
+                    canvas = ...            # 拼接
+                pipeline.submit(lambda: canvas.save(...))
+        print(pipeline.summary())
+
+    参数:
+        depth: 同时存在的画布数量上限（正在拼接、排队和正在编码的总和），1即完全串行
+    """
+
+    def __init__(self, depth=2):
+        self.depth = max(1, depth)
+        self._slots = threading.Semaphore(self.depth)
+        self._jobs = queue.Queue()
+        self._error = None
+        self._thread = None
+        self.compose_time = 0.0
+        self.encode_time = 0.0
+        self.wall_time = 0.0
+        self.pages = 0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._jobs.put(None)
+        self._thread.join()
+        self.wall_time = time.perf_counter() - self._start
+        if exc_type is None:
+            self._raise_error()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if self._error is None:
+                started = time.perf_counter()
+                try:
+                    job()
+                except BaseException as e:
+                    self._error = e
+                self.encode_time += time.perf_counter() - started
+            self._slots.release()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    @contextmanager
+    def compose(self):
+        """占用一个画布名额并计时拼接过程；名额在该页编码完成后释放"""
+        self._raise_error()
+        self._slots.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self._slots.release()
+            raise
+        finally:
+            self.compose_time += time.perf_counter() - started
+
+    def submit(self, job):
+        # 把编码+写盘任务交给后台线程，必须在 compose() 之后调用
+        self.pages += 1
+        self._jobs.put(job)
+
+    def overlap(self):
+        """返回 (重叠时间, 重叠比例)：比例为重叠时间占拼接与编码中较短者的比例"""
+        overlapped = max(0.0, self.compose_time + self.encode_time - self.wall_time)
+        shorter = min(self.compose_time, self.encode_time)
+        return overlapped, (overlapped / shorter if shorter > 0 else 0.0)
+
+    def summary(self):
+        overlapped, ratio = self.overlap()
+        return (f'拼接 {self.compose_time:.2f}秒，编码写盘 {self.encode_time:.2f}秒，'
+                f'总耗时 {self.wall_time:.2f}秒，重叠 {overlapped:.2f}秒 ({ratio:.0%})')
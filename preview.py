@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+低分辨率预览
+按正式拼接的排版结果把每一页缩小后快速画出来，用于在完整渲染前检查排版：
+尺寸只来自元数据索引，JPEG在DCT域直接解码到接近目标的大小，缩放用双线性，
+输出为低质量JPEG。排版结果与正式拼接共用，不重复计算
+"""
+
+import os
+import time
+
+from PIL import Image
+from PIL.Image import Resampling
+
+DEFAULT_PREVIEW_SCALE = 0.25
+PREVIEW_QUALITY = 60
+PREVIEW_DIR = 'preview'
+# JPEG 单边最大 65535 像素，更高的预览改存png
+JPEG_MAX_SIZE = 65500
+
+
+def preview_tile(path, size):
+    """快速解码并缩放一张图片，画质只要求能看清排版"""
+    im = Image.open(path)
+    if im.format == 'JPEG':
+        im.draft(None, size)
+    if im.mode not in ('RGB', 'RGBA', 'L'):
+        has_alpha = im.mode in ('LA', 'PA') or 'transparency' in im.info
+        im = im.convert('RGBA' if has_alpha else 'RGB')
+    # reducing_gap 先按整数倍缩小再双线性，大图缩得越小越快
+    return im.resize(size, Resampling.BILINEAR, reducing_gap=1.0)
+
+
+def _scale_box(box, scale):
+    x, y, w, h = box
+    return (round(x * scale), round(y * scale), max(1, round(w * scale)), max(1, round(h * scale)))
+
+
+def render_preview(pages, out_dir, scale=DEFAULT_PREVIEW_SCALE, executor=None):
+    """
+    按排版画出每一页的缩小预览，返回生成的文件列表
+
+    参数:
+        pages: [(文件名主干, (画布宽, 画布高), [(图片路径, (x, y, 宽, 高)), ...]), ...]，坐标为正式尺寸
+        out_dir: 预览文件夹
+        scale: 预览相对正式尺寸的比例
+        executor: 可选的进程池（如 TileLoader.executor），用于并行解码
+    """
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    mapper = executor.map if executor is not None else map
+    files = []
+    for stem, (width, height), items in pages:
+        canvas_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        canvas = Image.new('RGB', canvas_size, (255, 255, 255))
+        boxes = [_scale_box(box, scale) for _, box in items]
+        tiles = mapper(preview_tile, [path for path, _ in items], [(w, h) for _, _, w, h in boxes])
+        for (x, y, _, _), tile in zip(boxes, tiles):
+            # 透明图片按白底合成，预览统一存为不透明图片
+            canvas.paste(tile, (x, y), tile if tile.mode == 'RGBA' else None)
+        ext = 'jpg' if max(canvas_size) <= JPEG_MAX_SIZE else 'png'
+        file_path = os.path.join(out_dir, f'{stem}.{ext}')
+        canvas.save(file_path, quality=PREVIEW_QUALITY)
+        files.append(file_path)
+    print(f'预览完成：{len(files)} 页，耗时 {time.perf_counter() - started:.2f} 秒，保存至 {out_dir}')
+    return files
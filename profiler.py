@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分阶段性能统计
+记录 解码、缩放、粘贴、编码、写盘 等各阶段的耗时和字节数、像素数等计数，
+以及每一页、每一张图片的明细，最后输出JSON报告和可读的汇总。
+不开启时使用 NULL_PROFILER，各处调用只是空操作，几乎没有额外开销
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# 汇总时各阶段的显示顺序
+STAGE_ORDER = ('plan', 'decode', 'resize', 'paste', 'convert', 'reduce_mode', 'variant', 'encode', 'write')
+
+
+def peak_memory_kb():
+    """返回 (本进程, 子进程) 的峰值常驻内存（KB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1024 if sys.platform == 'darwin' else 1  # macOS 以字节为单位
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    return own, children
+
+
+class Profiler:
+    """
+    用法:
+        profiler = Profiler()
+        with profiler.stage('paste', pixels=w * h):
+            ...
+        profiler.add('decode', 0.12, bytes=1024)   # 在其他进程中测得的耗时
+        print(profiler.summary())
+        profiler.save('profile.json')
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.stages = {}
+        self.tiles = []
+        self.pages = []
+
+    def add(self, name, seconds=0.0, **counters):
+        # 累加一个阶段的耗时和计数，可以在多个线程中调用
+        with self._lock:
+            stage = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0})
+            stage['count'] += 1
+            stage['seconds'] += seconds
+            for key, value in counters.items():
+                stage[key] = stage.get(key, 0) + value
+
+    @contextmanager
+    def stage(self, name, **counters):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, **counters)
+
+    def tile(self, **info):
+        # 记录单张图片的明细
+        with self._lock:
+            self.tiles.append(info)
+
+    def page(self, **info):
+        # 记录单页的明细
+        with self._lock:
+            self.pages.append(info)
+
+    def report(self):
+        own, children = peak_memory_kb()
+        return {
+            'wall_seconds': round(time.perf_counter() - self._started, 4),
+            'peak_rss_kb': own,
+            'peak_rss_children_kb': children,
+            'stages': self.stages,
+            'pages': self.pages,
+            'tiles': self.tiles,
+        }
+
+    def summary(self):
+        report = self.report()
+        lines = [f"总耗时 {report['wall_seconds']:.2f}秒，峰值内存 {report['peak_rss_kb']} KB"
+                 + (f"（子进程 {report['peak_rss_children_kb']} KB）" if report['peak_rss_children_kb'] else '')]
+        names = sorted(self.stages, key=lambda n: (STAGE_ORDER.index(n) if n in STAGE_ORDER else len(STAGE_ORDER), n))
+        for name in names:
+            stage = self.stages[name]
+            extra = ''.join(f'，{key} {value}' for key, value in stage.items()
+                            if key not in ('count', 'seconds'))
+            lines.append(f"  {name:<8} {stage['seconds']:8.3f}秒  {stage['count']} 次{extra}")
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1)
+
+
+class NullProfiler:
+    # 不开启统计时的空实现
+    enabled = False
+    _context = nullcontext()
+
+    def add(self, name, seconds=0.0, **counters):
+        pass
+
+    def stage(self, name, **counters):
+        return self._context
+
+    def tile(self, **info):
+        pass
+
+    def page(self, **info):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
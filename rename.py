@@ -1,22 +1,148 @@
-from glob import glob
-from PIL.Image import open, new, Resampling
-from pathlib import Path
-from re import split
-import os
-
-
-folder_path = input('输入图片文件夹路径：').strip()
-file_list = sorted(os.listdir(folder_path))
-# 过滤出图片文件（按实际需求筛选图片扩展名）
-image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-image_files = [f for f in file_list if os.path.splitext(f)[1].lower() in image_extensions]
-
-# 开始重命名
-for idx, filename in enumerate(image_files, start=1):
-    ext = os.path.splitext(filename)[1]  # 保留原始扩展名
-    new_name = f"{idx:02d}{ext}"
-    src = os.path.join(folder_path, filename)
-    dst = os.path.join(folder_path, new_name)
-    os.rename(src, dst)
-
-print("重命名完成！")
+"""
+批量重命名图片为 01.jpg、02.jpg ...
+
+按与拼图相同的自然顺序排序（img2 在 img10 之前）。分两步改名：先全部改成临时文件名，
+再改成最终文件名，目标文件名已被占用或互相交换时也不会覆盖文件。
+改名前把对照表写入文件夹中的日志，可以用 --undo 撤销，中途中断时撤销也能恢复。
+改名前可以并发计算内容哈希，连同元数据索引中的记录一起移到新文件名下，
+改名后的图片不会被当作新图片重新读取、缩放，结果文件夹中的页面也不必重新生成
+"""
+import argparse
+import json
+import os
+import uuid
+
+from main import sorted_alphanumeric
+from image_index import image_hashes, rename_entries
+
+# 过滤出图片文件（按实际需求筛选图片扩展名）
+image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
+JOURNAL_NAME = '.rename_journal.json'
+
+
+def list_image_names(folder_path):
+    # 文件夹中的图片文件名，按自然顺序排序
+    names = [f for f in os.listdir(folder_path)
+             if os.path.splitext(f)[1].lower() in image_extensions and not f.startswith('.')]
+    return sorted_alphanumeric(names)
+
+
+def plan_renames(folder_path, start=1, digits=2):
+    """
+    计算改名方案，返回 [(原文件名, 新文件名), ...]，已经是目标名字的文件不在其中
+
+    参数:
+        start: 起始编号
+        digits: 编号的最少位数，图片数量更多时自动增加
+    """
+    names = list_image_names(folder_path)
+    digits = max(digits, len(str(start + len(names) - 1)))
+    plan = []
+    for idx, filename in enumerate(names, start=start):
+        ext = os.path.splitext(filename)[1]  # 保留原始扩展名
+        new_name = f"{idx:0{digits}d}{ext}"
+        if new_name != filename:
+            plan.append((filename, new_name))
+    # 目标文件名被不参与改名的文件占用时（如大小写不同的同名文件）不能继续
+    moving = {src for src, _ in plan}
+    existing = set(os.listdir(folder_path))
+    blocked = [dst for _, dst in plan if dst in existing and dst not in moving]
+    if blocked:
+        raise FileExistsError(f"目标文件已存在且不参与改名: {', '.join(blocked)}")
+    return plan
+
+
+def _write_journal(folder_path, phase, entries):
+    # 先写临时文件再替换，日志总是完整的。phase 记录进行到哪一步，撤销时据此判断文件在哪里
+    path = os.path.join(folder_path, JOURNAL_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'phase': phase, 'entries': entries}, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _rename(folder_path, src, dst):
+    if src != dst:
+        os.rename(os.path.join(folder_path, src), os.path.join(folder_path, dst))
+
+
+def apply_renames(folder_path, plan):
+    """按方案改名，并把对照表写入日志供撤销使用"""
+    token = uuid.uuid4().hex[:8]
+    entries = [{'original': src, 'temp': f'.rename-{token}-{i}{os.path.splitext(src)[1]}', 'final': dst}
+               for i, (src, dst) in enumerate(plan)]
+    # 第一步：全部改成临时名，日志在改名前写好，中途中断时可以据此恢复
+    _write_journal(folder_path, 'temp', entries)
+    for e in entries:
+        _rename(folder_path, e['original'], e['temp'])
+    # 第二步：临时名改成目标名，此时目标名一定没有被占用
+    _write_journal(folder_path, 'final', entries)
+    for e in entries:
+        _rename(folder_path, e['temp'], e['final'])
+    rename_entries(folder_path, dict(plan))
+    _write_journal(folder_path, 'done', entries)
+
+
+def undo_renames(folder_path):
+    """按日志撤销上一次改名，也能恢复中途中断的改名，返回恢复的文件数"""
+    path = os.path.join(folder_path, JOURNAL_NAME)
+    with open(path, 'r', encoding='utf-8') as f:
+        journal = json.load(f)
+    existing = set(os.listdir(folder_path))
+    moves = []
+    for e in journal['entries']:
+        if e['temp'] in existing:
+            moves.append((e['temp'], e))
+        elif journal['phase'] != 'temp':
+            # 第一步已经完成，不在临时名上的文件一定已经改成了目标名
+            moves.append((e['final'], e))
+        # 否则第一步中断时还没轮到这个文件，仍是原名
+    # 同样分两步，原名被其他文件的目标名占用时也不会覆盖
+    for current, e in moves:
+        _rename(folder_path, current, e['temp'])
+    for _, e in moves:
+        _rename(folder_path, e['temp'], e['original'])
+    if journal['phase'] == 'done':
+        # 只有完整改名后索引中的记录才在新文件名下
+        rename_entries(folder_path, {e['final']: e['original'] for e in journal['entries']})
+    os.remove(path)
+    return len(moves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按自然顺序把图片重命名为 01、02 ...')
+    parser.add_argument('folder', nargs='?', help='图片文件夹，不指定则运行时输入')
+    parser.add_argument('--start', type=int, default=1, help='起始编号')
+    parser.add_argument('--digits', type=int, default=2, help='编号的最少位数')
+    parser.add_argument('--dry-run', action='store_true', help='只显示改名方案，不改名')
+    parser.add_argument('--undo', action='store_true', help='撤销上一次改名')
+    parser.add_argument('--no-hash', dest='hash', action='store_false',
+                        help='改名前不计算内容哈希（计算后改名的图片不会被当作新图片重新处理）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='计算哈希的线程数')
+    args = parser.parse_args()
+
+    folder_path = args.folder or input('输入图片文件夹路径：').strip()
+
+    if args.undo:
+        print(f"已撤销 {undo_renames(folder_path)} 个文件的改名")
+        return
+
+    plan = plan_renames(folder_path, args.start, args.digits)
+    if not plan:
+        print("文件名已经是目标格式，无需改名")
+        return
+    for src, dst in plan:
+        print(f"{src} -> {dst}")
+    if args.dry_run:
+        print(f"共 {len(plan)} 个文件（未改名）")
+        return
+
+    if args.hash:
+        # 哈希记入元数据索引，改名时随记录一起移动
+        image_hashes([os.path.join(folder_path, name) for name in list_image_names(folder_path)],
+                     args.workers)
+    apply_renames(folder_path, plan)
+    print(f"重命名完成！共 {len(plan)} 个文件，可用 --undo 撤销")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地HTTP拼图服务
+供其他工具调用长图和矩阵拼接，不必运行交互式脚本。只监听本机地址：
+    POST /long    长图，返回单页图片或多页的zip
+    POST /matrix  矩阵图
+    GET  /health  队列和并发状态
+请求体为 multipart/form-data 上传的图片（按上传顺序拼接），或JSON
+{"paths": [...]} / {"folder": "..."} 指定服务器上 --root 以内的图片；
+拼接参数放在查询字符串中，名称与 cli.py 的参数相同，如 /long?width=800&pages=3&format=jpg。
+
+同时拼接的请求数固定，其余请求在有界队列中等待，名额用完时在读取请求体之前就返回503和 Retry-After；
+上传的图片边读边写入临时文件夹，每个请求读取时只占一小块缓冲区；
+所有请求共用一个解码进程池和缩放缓存。结果文件按块流式返回，不整体读入内存，
+排队、拼接等各阶段耗时放在 Server-Timing 响应头中
+
+示例:
+    python server.py --port 8700 --concurrency 2 --workers 4 --root origin_pic
+    curl -F files=@1.jpg -F files=@2.jpg "http://127.0.0.1:8700/long?width=800&pages=1" -o out.png
+"""
+
+import argparse
+import io
+import ipaddress
+import json
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import zipfile
+from email.parser import BytesParser
+from email.policy import HTTP
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+from main import merge_image, read_pic, list_images, sorted_alphanumeric
+from matrix_image_merge import merge_images
+from image_worker import TileLoader
+from image_index import forget_index
+from tile_cache import TileCache, DEFAULT_CACHE_SIZE
+from cli import positive_int, non_negative_int, positive_float, byte_size
+
+DEFAULT_PORT = 8700
+DEFAULT_CONCURRENCY = 2
+DEFAULT_QUEUE_SIZE = 8
+# 单个请求体的大小上限
+DEFAULT_MAX_UPLOAD = 256 << 20
+# 流式读取请求体和返回结果时每块的大小
+CHUNK_SIZE = 1 << 16
+# multipart 每个部分的头部和普通表单字段的大小上限
+MAX_FIELD_SIZE = 1 << 16
+# JSON 请求体（路径列表）的大小上限
+MAX_JSON_SIZE = 4 << 20
+CONTENT_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg',
+                 'webp': 'image/webp', 'bmp': 'image/bmp', 'gif': 'image/gif'}
+
+
+class RequestError(Exception):
+    """请求本身有问题，按 status 返回给客户端"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    # 一个排队中的拼接任务，run(loader) 返回输出文件列表
+    def __init__(self, run):
+        self.run = run
+        self.submitted = time.perf_counter()
+        self.started = self.finished = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MergeService:
+    """
+    有界的拼接线程池
+
+    参数:
+        concurrency: 同时拼接的请求数，每个请求同时只占一张画布（流水线深度）
+        queue_size: 正在拼接的请求之外，读取请求体和排队等待的请求数上限
+        loader: 所有请求共用的 TileLoader，由调用方负责关闭
+
+    请求先用 reserve 占一个名额再读取请求体，没有名额时抛出 queue.Full；
+    占到名额后 submit，任务结束并返回结果后 release
+    """
+
+    def __init__(self, loader, concurrency=DEFAULT_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE):
+        self.loader = loader
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        # 名额数限制了队列长度，队列本身不再设上限
+        self.queue = queue.Queue()
+        self.running = 0
+        self.reserved = 0
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def full(self):
+        return self.reserved >= self.concurrency + self.queue_size
+
+    def reserve(self):
+        # 不阻塞：没有名额时由调用方返回503，让客户端稍后重试
+        with self._lock:
+            if self.full():
+                raise queue.Full
+            self.reserved += 1
+
+    def release(self):
+        with self._lock:
+            self.reserved -= 1
+
+    def submit(self, run):
+        job = Job(run)
+        self.queue.put(job)
+        return job
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self.running += 1
+            job.started = time.perf_counter()
+            try:
+                job.result = job.run(self.loader)
+            except Exception as e:
+                job.error = e
+            finally:
+                job.finished = time.perf_counter()
+                with self._lock:
+                    self.running -= 1
+                job.done.set()
+
+    def status(self):
+        return {'concurrency': self.concurrency, 'running': self.running, 'reserved': self.reserved,
+                'queued': self.queue.qsize(), 'queue_size': self.queue_size}
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def _is_within(path, roots):
+    path = Path(path).resolve()
+    return any(path == root or root in path.parents for root in roots)
+
+
+def _int_param(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RequestError(400, f'参数 {name} 必须为整数')
+
+
+def long_job(paths, params, memory_limit=None):
+    """按查询参数生成长图任务，参数名和默认值与 cli.py long 相同"""
+    format = params.get('format', 'png').lower()
+    width = _int_param(params, 'width', 800)
+    space = _int_param(params, 'space', 10)
+    pages = _int_param(params, 'pages', 9)
+    quality = _int_param(params, 'quality', 80)
+    max_height = _int_param(params, 'max_height')
+    max_bytes = _int_param(params, 'max_bytes')
+    if format not in CONTENT_TYPES or width <= 0 or pages <= 0:
+        raise RequestError(400, '无效的 format、width 或 pages')
+
+    def run(loader, out_dir):
+        merge_image(read_pic(paths), format, width, space, pages, quality, out_dir,
+                    max_height=max_height, incremental=False, loader=loader, max_bytes=max_bytes,
+                    pipeline_depth=1, memory_limit=memory_limit)
+        return sorted_alphanumeric(glob(os.path.join(out_dir, '*.' + format)))
+    return run
+
+
+def matrix_job(paths, params, memory_limit=None):
+    """按查询参数生成矩阵任务，参数名与 cli.py matrix 相同"""
+    format = params.get('format', 'png').lower()
+    layout = params.get('layout', 'grid')
+    if format not in CONTENT_TYPES or layout not in ('grid', 'justified'):
+        raise RequestError(400, '无效的 format 或 layout')
+    options = dict(rows=_int_param(params, 'rows'), cols=_int_param(params, 'cols'),
+                   gap=_int_param(params, 'gap', 0), width=_int_param(params, 'width'),
+                   height=_int_param(params, 'height'), layout=layout)
+
+    def run(loader, out_dir):
+        output_path = os.path.join(out_dir, 'merged.' + format)
+        merge_images(paths, output_path, loader=loader, memory_limit=memory_limit, **options)
+        return [output_path] if os.path.exists(output_path) else []
+    return run
+
+
+JOBS = {'/long': long_job, '/matrix': matrix_job}
+
+
+class ChunkedWriter(io.RawIOBase):
+    # 把写入的数据按 HTTP/1.1 分块传输编码发给客户端
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b'%X\r\n' % len(data))
+            self.wfile.write(data)
+            self.wfile.write(b'\r\n')
+        return len(data)
+
+    def finish(self):
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class BodyReader:
+    # 按 Content-Length 读取请求体，不会读到下一个请求
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=CHUNK_SIZE):
+        data = self.rfile.read(min(size, self.remaining)) if self.remaining > 0 else b''
+        self.remaining -= len(data)
+        return data
+
+    def drain(self):
+        # 丢弃没有读取的部分，连接可以继续使用
+        while self.read():
+            pass
+
+
+def save_multipart(body, boundary, input_dir, params):
+    """
+    边读边解析 multipart/form-data 请求体，上传的文件按顺序写入 input_dir
+
+    参数:
+        body: BodyReader
+        boundary: 分隔符（bytes）
+        params: 普通表单字段写入其中，与查询参数等价
+    返回:
+        按上传顺序排列的文件路径
+    """
+    delimiter = b'\r\n--' + boundary
+    # 补上开头的换行，第一个分隔符和后面的分隔符形式相同
+    buffer = b'\r\n'
+    paths = []
+
+    def fill():
+        nonlocal buffer
+        data = body.read()
+        if not data:
+            raise RequestError(400, 'multipart 请求体不完整')
+        buffer += data
+
+    def find(token):
+        # 只用于查找头部的结尾，头部有长度上限
+        while token not in buffer:
+            if len(buffer) > MAX_FIELD_SIZE:
+                raise RequestError(400, 'multipart 头部过长')
+            fill()
+        return buffer.index(token)
+
+    def copy_until_delimiter(write):
+        # 把下一个分隔符之前的内容交给 write，缓冲区中只保留可能是分隔符开头的尾部
+        nonlocal buffer
+        while True:
+            index = buffer.find(delimiter)
+            if index >= 0:
+                write(buffer[:index])
+                buffer = buffer[index + len(delimiter):]
+                return
+            keep = len(delimiter) - 1
+            if len(buffer) > keep:
+                write(buffer[:-keep])
+                buffer = buffer[-keep:]
+            fill()
+
+    # 第一个分隔符之前的内容忽略
+    copy_until_delimiter(lambda data: None)
+    while True:
+        while len(buffer) < 2:
+            fill()
+        if buffer.startswith(b'--'):
+            return paths
+        # 跳过分隔符所在行的其余部分，各部分的头部以空行结束（没有头部时紧接着就是空行）
+        buffer = buffer[find(b'\r\n'):]
+        end = find(b'\r\n\r\n')
+        headers = BytesParser(policy=HTTP).parsebytes(buffer[2:end] + b'\r\n\r\n')
+        buffer = buffer[end + 4:]
+        filename = headers.get_filename()
+        if filename is None:
+            field = io.BytesIO()
+
+            def write_field(data):
+                if field.tell() + len(data) > MAX_FIELD_SIZE:
+                    raise RequestError(400, '表单字段过长')
+                field.write(data)
+            copy_until_delimiter(write_field)
+            params[headers.get_param('name', header='content-disposition')] = field.getvalue().decode()
+            continue
+        path = os.path.join(input_dir, f'{len(paths):05d}{Path(filename).suffix.lower()}')
+        with open(path, 'wb') as f:
+            copy_until_delimiter(f.write)
+        paths.append(path)
+
+
+class MergeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 由 serve() 设置
+    service = None
+    roots = ()
+    max_upload = DEFAULT_MAX_UPLOAD
+    memory_limit = None
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/health':
+            self._send_json(200, self.service.status())
+        else:
+            self._send_json(404, {'error': '不存在的路径'})
+
+    def handle_expect_100(self):
+        # 客户端等待 100 Continue 再发送请求体时，没有名额就直接拒绝，请求体不必发送
+        if self.service.full():
+            self._send_error(503, '排队的请求已满，请稍后重试', {'Retry-After': '1'})
+            return False
+        return super().handle_expect_100()
+
+    def do_POST(self):
+        received = time.perf_counter()
+        url = urlsplit(self.path)
+        body = BodyReader(self.rfile, int(self.headers.get('Content-Length') or 0))
+        work_dir = tempfile.mkdtemp(prefix='merge-')
+        reserved = False
+        try:
+            if url.path not in JOBS:
+                raise RequestError(404, '不存在的路径')
+            if body.remaining > self.max_upload:
+                raise RequestError(413, f'请求体超过上限 {self.max_upload} 字节')
+            # 先占名额再读取请求体，队列满时上传的数据不会进入内存或磁盘
+            try:
+                self.service.reserve()
+            except queue.Full:
+                body.drain()
+                raise RequestError(503, '排队的请求已满，请稍后重试')
+            reserved = True
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            paths = self._read_inputs(body, work_dir, params)
+            if not paths:
+                raise RequestError(400, '没有图片')
+            run = JOBS[url.path](paths, params, self.memory_limit)
+            out_dir = os.path.join(work_dir, 'out')
+            job = self.service.submit(lambda loader: run(loader, out_dir))
+            parsed = job.submitted
+            job.done.wait()
+            if job.error is not None:
+                raise job.error
+            if not job.result:
+                raise RequestError(422, '没有生成结果（预估内存超过上限或图片都无法读取）')
+            timing = {'parse': parsed - received, 'queue': job.started - parsed,
+                      'merge': job.finished - job.started}
+            self._send_files(job.result, timing)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已经断开
+            self.close_connection = True
+        except RequestError as e:
+            headers = {'Retry-After': '1'} if e.status == 503 else {}
+            self._send_error(e.status, str(e), headers)
+        except Exception as e:
+            self._send_error(500, f'{type(e).__name__}: {e}')
+        finally:
+            if reserved:
+                self.service.release()
+            forget_index(os.path.join(work_dir, 'in'))
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _read_inputs(self, body, work_dir, params):
+        # 返回按顺序排列的图片路径；上传的图片保存在本次请求的临时文件夹中
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            boundary = BytesParser(policy=HTTP).parsebytes(
+                b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n').get_boundary()
+            if not boundary:
+                raise RequestError(400, 'multipart 请求缺少 boundary')
+            input_dir = os.path.join(work_dir, 'in')
+            os.makedirs(input_dir)
+            return save_multipart(body, boundary.encode('latin-1'), input_dir, params)
+        if body.remaining > MAX_JSON_SIZE:
+            raise RequestError(413, f'JSON 请求体超过上限 {MAX_JSON_SIZE} 字节')
+        try:
+            data = json.loads(body.read(MAX_JSON_SIZE) or b'{}')
+        except ValueError:
+            raise RequestError(400, '请求体不是有效的JSON')
+        if 'folder' in data:
+            paths = list_images(data['folder'])
+            requested = [data['folder']]
+        else:
+            paths = requested = [str(p) for p in data.get('paths', [])]
+        if not all(_is_within(p, self.roots) for p in requested):
+            raise RequestError(403, '只能读取 --root 指定的文件夹中的图片')
+        missing = [p for p in paths if not os.path.isfile(p)]
+        if missing:
+            raise RequestError(400, f'文件不存在: {missing[0]}')
+        return paths
+
+    def _send_files(self, files, timing):
+        # 单个文件原样返回，多页打包为zip（图片已经压缩过，zip中只存储）；都按块流式发送
+        self.send_response(200)
+        if len(files) == 1:
+            format = Path(files[0]).suffix[1:].lower()
+            self.send_header('Content-Type', CONTENT_TYPES.get(format, 'application/octet-stream'))
+        else:
+            self.send_header('Content-Type', 'application/zip')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Pages', str(len(files)))
+        self.send_header('Server-Timing', ', '.join(f'{name};dur={seconds * 1000:.1f}'
+                                                    for name, seconds in timing.items()))
+        self.end_headers()
+        writer = ChunkedWriter(self.wfile)
+        if len(files) == 1:
+            with open(files[0], 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    writer.write(chunk)
+        else:
+            with io.BufferedWriter(writer, CHUNK_SIZE) as buffered:
+                with zipfile.ZipFile(buffered, 'w', zipfile.ZIP_STORED) as archive:
+                    for path in files:
+                        archive.write(path, os.path.basename(path))
+        writer.finish()
+
+    def _send_error(self, status, message, headers=None):
+        # 出错时请求体可能没有读完，不再复用这个连接
+        self.close_connection = True
+        self._send_json(status, {'error': message}, dict(headers or {}, Connection='close'))
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, concurrency=DEFAULT_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE,
+          workers=1, reducing_gap=None, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, roots=(),
+          max_upload=DEFAULT_MAX_UPLOAD, memory_limit=None):
+    """
+    启动服务，阻塞到 Ctrl+C
+
+    参数:
+        host: 监听地址，只允许本机地址
+        concurrency / queue_size: 见 MergeService
+        workers: 所有请求共用的解码进程数
+        roots: 允许按路径读取的文件夹
+        max_upload: 请求体大小上限（字节）
+        memory_limit: 每个请求的峰值内存上限，见 merge_image
+    """
+    if not is_loopback(host):
+        raise ValueError(f'只能监听本机地址: {host}')
+    cache = TileCache(cache_dir, cache_size) if cache_dir else None
+    with TileLoader(workers, reducing_gap, cache) as loader:
+        service = MergeService(loader, concurrency, queue_size)
+        handler = type('Handler', (MergeHandler,), dict(
+            service=service, roots=tuple(Path(r).resolve() for r in roots),
+            max_upload=max_upload, memory_limit=memory_limit))
+        with ThreadingHTTPServer((host, port), handler) as httpd:
+            print(f'拼图服务已启动: http://{host}:{httpd.server_address[1]}/ '
+                  f'(同时拼接 {concurrency} 个，排队上限 {queue_size})')
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地HTTP拼图服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，只允许本机地址')
+    parser.add_argument('--port', type=non_negative_int, default=DEFAULT_PORT, help='端口，0为随机')
+    parser.add_argument('--concurrency', type=positive_int, default=DEFAULT_CONCURRENCY, help='同时拼接的请求数')
+    parser.add_argument('--queue-size', type=positive_int, default=DEFAULT_QUEUE_SIZE,
+                        help='排队等待的请求数上限，超过时返回503')
+    parser.add_argument('--workers', type=positive_int, default=os.cpu_count() or 1, help='共用的解码进程数')
+    parser.add_argument('--reducing-gap', type=positive_float, default=None, help='快速缩放容差')
+    parser.add_argument('--cache-dir', default=None, help='缩放结果缓存目录')
+    parser.add_argument('--cache-size', type=byte_size, default=DEFAULT_CACHE_SIZE, help='缓存大小上限')
+    parser.add_argument('--root', dest='roots', action='append', default=[],
+                        help='允许按路径读取的文件夹，可重复；不指定则只接受上传')
+    parser.add_argument('--max-upload', type=byte_size, default=DEFAULT_MAX_UPLOAD, help='请求体大小上限')
+    parser.add_argument('--memory-limit', type=byte_size, default=None, help='每个请求的峰值内存上限')
+    args = parser.parse_args()
+    if not is_loopback(args.host):
+        parser.error('只能监听本机地址，如 127.0.0.1 或 localhost')
+    serve(args.host, args.port, args.concurrency, args.queue_size, args.workers, args.reducing_gap,
+          args.cache_dir, args.cache_size, args.roots, args.max_upload, args.memory_limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按文件大小预算编码
+微博等平台限制单张图片的大小。给定字节预算时，对同一张拼好的画布在内存中
+以不同质量编码，用多路二分（每轮并行编码若干个质量）找出不超过预算的最高质量，
+不写试探文件，也不重新拼接
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# 有质量参数可以搜索的格式；png等无损格式只能编码一次
+QUALITY_FORMATS = ('jpg', 'jpeg', 'webp')
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+# 每轮并行编码数的默认上限；每个编码线程各持有一份画布副本
+MAX_WORKERS = 4
+
+
+def encode_image(image, format, **params):
+    """把图片编码到内存，返回字节串，params 原样传给 Image.save"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=Image.registered_extensions()['.' + format.lower()], **params)
+    return buffer.getvalue()
+
+
+def _candidates(lo, hi, count):
+    # lo 与 hi 之间（不含两端）均匀取 count 个质量
+    step = (hi - lo) / (count + 1)
+    return sorted({min(hi - 1, max(lo + 1, round(lo + step * (i + 1)))) for i in range(count)})
+
+
+def fit_budget(image, format, max_bytes, max_quality=MAX_QUALITY, min_quality=MIN_QUALITY,
+               workers=None, **params):
+    """
+    在预算内以尽量高的质量编码图片
+
+    参数:
+        image: 拼好的画布，各次编码共用，不会被修改
+        format: 输出格式，jpg/jpeg/webp 搜索质量，其他格式以 optimize 编码一次
+        max_bytes: 字节预算
+        max_quality: 质量上限（通常为用户指定的质量）
+        min_quality: 质量下限，下限仍超出预算时返回下限的结果
+        workers: 每轮并行编码的数量，默认为CPU核数且不超过 MAX_WORKERS
+        params: 其他编码参数，如JPEG的 subsampling、WebP的 method
+
+    返回 (编码结果, 选定的质量)；无损格式的质量为None。调用方根据长度判断是否超出预算
+    """
+    if format.lower() not in QUALITY_FORMATS:
+        return encode_image(image, format, optimize=True, **params), None
+    workers = workers or min(os.cpu_count() or 1, MAX_WORKERS)
+    # Image.save 会把编码参数写到图片对象上，同一个对象不能在多个线程中同时保存，
+    # 所以每个编码线程第一次编码时复制一份画布，之后一直使用自己的副本
+    local = threading.local()
+
+    def encode(q):
+        if not hasattr(local, 'image'):
+            local.image = image.copy()
+        return encode_image(local.image, format, quality=q, **params)
+
+    # 先在当前线程试上限：大多数页面直接满足预算，只需编码一次，也不必复制画布
+    first = encode_image(image, format, quality=max_quality, **params)
+    if len(first) <= max_bytes:
+        return first, max_quality
+    # 不变式：质量 <= lo 的都在预算内（lo 为下限减一时表示尚未找到），>= hi 的都超出
+    lo, hi = min_quality - 1, max_quality
+    best = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = _candidates(lo, hi, workers)
+        while pending:
+            for q, data in zip(pending, executor.map(encode, pending)):
+                # 质量与大小不严格单调时，以遇到的第一个超出预算的质量为准
+                if q >= hi:
+                    continue
+                if len(data) <= max_bytes:
+                    lo, best = q, (data, q)
+                else:
+                    hi = q
+            pending = _candidates(lo, hi, workers) if hi - lo > 1 else []
+    if best is None:
+        return encode_image(image, format, quality=min_quality, **params), min_quality
+    return best
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按水平条带流式编码的图片写入器
+超长图不需要一次性在内存中分配整张画布：像素行按条带依次送入zlib，边压缩边写盘。
+安装了numpy时每行像PIL一样自适应选择滤波方式，文件大小与PIL整图保存相近；
+未安装时每行不滤波，文件会明显变大
+"""
+
+import struct
+import zlib
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# 能否按行自适应滤波；不能时流式写出的文件明显比PIL保存的大，调用方不应自动选择流式写出
+ADAPTIVE_FILTERING = HAS_NUMPY
+
+# PIL模式 -> (PNG颜色类型, 每像素字节数)
+PNG_COLOR_TYPES = {
+    'L': (0, 1),
+    'RGB': (2, 3),
+    'LA': (4, 2),
+    'RGBA': (6, 4),
+}
+
+# 支持流式写出的格式
+STREAMABLE_FORMATS = ('png',)
+
+
+def is_streamable(format, mode):
+    # 判断该格式和模式能否流式写出，不能时调用方应回退到整张画布
+    return format.lower() in STREAMABLE_FORMATS and mode in PNG_COLOR_TYPES
+
+
+class PngStripWriter:
+    """
+    逐条带写入像素的PNG编码器
+
+    图片总尺寸需要预先确定；每行在 None/Sub/Up/Average/Paeth 五种滤波中选择
+    滤波后各字节（按有符号数）绝对值之和最小的一种，与PIL的选择方法相同，只需要保留上一行；
+    解码后的像素与PIL整图保存的结果完全一致，但文件字节不一定相同
+    """
+
+    def __init__(self, path, width, height, mode, compress_level=6):
+        if mode not in PNG_COLOR_TYPES:
+            raise ValueError(f"不支持流式写出的图片模式: {mode}")
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows_written = 0
+        color_type, self.bytes_per_pixel = PNG_COLOR_TYPES[mode]
+        # 上一行的原始像素，第一行的上一行按全0处理
+        self._previous = bytes(width * self.bytes_per_pixel)
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(path, 'wb')
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+    def _write_chunk(self, tag, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(tag)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+    def _write_idat(self, data):
+        if data:
+            self._write_chunk(b'IDAT', data)
+
+    def _write_raw(self, raw, rows):
+        if self.rows_written + rows > self.height:
+            raise ValueError("写入的行数超过了图片高度")
+        if ADAPTIVE_FILTERING:
+            lines = self._filter_rows(raw, rows)
+        else:
+            stride = self.width * self.bytes_per_pixel
+            # 每行前加一个滤波类型字节 0
+            lines = b''.join(b'\x00' + raw[y * stride:(y + 1) * stride] for y in range(rows))
+        self._write_idat(self._compressor.compress(lines))
+        self.rows_written += rows
+
+    def _filter_rows(self, raw, rows):
+        # 对一个条带的所有行同时计算五种滤波，再逐行取代价最小的一种；
+        # 各种预测都只用原始像素，条带内的行互不依赖
+        stride = self.width * self.bytes_per_pixel
+        bpp = self.bytes_per_pixel
+        current = np.frombuffer(raw, dtype=np.uint8).reshape(rows, stride)
+        above = np.empty_like(current)
+        above[0] = np.frombuffer(self._previous, dtype=np.uint8)
+        above[1:] = current[:-1]
+        left = np.zeros_like(current)
+        left[:, bpp:] = current[:, :-bpp]
+        upper_left = np.zeros_like(current)
+        upper_left[:, bpp:] = above[:, :-bpp]
+        # Paeth：取 left、above、upper_left 中最接近 left + above - upper_left 的一个
+        a, b, c = (x.astype(np.int16) for x in (left, above, upper_left))
+        pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+        paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, above, upper_left))
+        average = ((a + b) >> 1).astype(np.uint8)
+        # uint8 相减按256取模，正是PNG滤波的定义
+        candidates = [current, current - left, current - above, current - average, current - paeth]
+        costs = np.stack([np.abs(f.view(np.int8).astype(np.int16)).sum(axis=1) for f in candidates])
+        # 代价相同时取编号小的滤波
+        best = costs.argmin(axis=0)
+        lines = np.empty((rows, stride + 1), dtype=np.uint8)
+        lines[:, 0] = best
+        lines[:, 1:] = np.choose(best[:, None], candidates)
+        self._previous = current[-1].tobytes()
+        return lines.tobytes()
+
+    def write_bytes(self, raw, rows):
+        """写入 rows 行原始像素字节（按该模式逐行紧密排列）"""
+        if len(raw) != self.width * self.bytes_per_pixel * rows:
+            raise ValueError("像素字节数与行数不匹配")
+        self._write_raw(raw, rows)
+
+    def write(self, band):
+        """写入一个条带，band 为宽度等于图片宽度的PIL图片"""
+        if band.size[0] != self.width:
+            raise ValueError("条带宽度与图片宽度不一致")
+        if band.mode != self.mode:
+            band = band.convert(self.mode)
+        self._write_raw(band.tobytes(), band.size[1])
+
+    def write_fill(self, rows, color):
+        """写入 rows 行纯色像素（用于图片间距）"""
+        if rows <= 0:
+            return
+        if isinstance(color, int):
+            color = (color,)
+        pixel = bytes(color[:self.bytes_per_pixel])
+        self._write_raw(pixel * (self.width * rows), rows)
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"图片高度为 {self.height}，实际只写入了 {self.rows_written} 行")
+            self._write_idat(self._compressor.flush())
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+缩放结果缓存
+以 原图内容哈希 + 目标尺寸 + 缩放算法参数 为键，把缩放后的图片以原始像素格式保存在磁盘上。
+只改变间距、页数、格式或质量重新拼图时可以跳过全部解码和缩放。
+缓存按最近使用时间(LRU)淘汰，总大小不超过设定的上限
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from PIL import Image
+
+# 默认缓存上限 1GB
+DEFAULT_CACHE_SIZE = 1 << 30
+TILE_SUFFIX = '.tile'
+CACHE_APP_NAME = 'long_pic'
+
+
+def default_cache_dir():
+    """交互式运行和监视模式默认使用的缓存目录，放在用户缓存目录下而不是脚本所在目录"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, CACHE_APP_NAME, 'tiles')
+
+
+def tile_key(content_hash, size, convert=True, reducing_gap=None, resample='LANCZOS'):
+    # 缩放结果只取决于原图内容和这些参数，与文件名、路径无关
+    # convert 为布尔值时保持原来的键，已有缓存仍然有效
+    convert = int(convert) if isinstance(convert, bool) else convert
+    raw = f'{content_hash}|{size[0]}x{size[1]}|{resample}|{convert}|{reducing_gap}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class TileCache:
+    """
+    磁盘上的缩放结果缓存
+
+    只保存目录和上限两个字段，可以直接传给进程池中的工作进程使用；
+    多个进程同时写入时通过临时文件+替换保证不会读到写了一半的文件
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_CACHE_SIZE):
+        self.folder = str(folder)
+        self.max_bytes = max_bytes
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + TILE_SUFFIX)
+
+    def get(self, key):
+        """读取缓存的图片，不存在或损坏时返回None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                mode, width, height = f.readline().decode('ascii').split()
+                data = f.read()
+            tile = Image.frombytes(mode, (int(width), int(height)), data)
+        except (OSError, ValueError):
+            return None
+        # 更新修改时间作为最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return tile
+
+    def put(self, key, tile):
+        path = self._path(key)
+        # 临时文件名区分进程和线程，同一进程中多个线程共用缓存时也不会互相覆盖
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(f'{tile.mode} {tile.size[0]} {tile.size[1]}\n'.encode('ascii'))
+                f.write(tile.tobytes())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入缩放缓存失败: {e}")
+
+    def evict(self):
+        """按最近使用时间从旧到新删除，直到总大小不超过上限"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(TILE_SUFFIX):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
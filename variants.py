@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+一次拼接输出多种格式
+每页只拼接一次，同一张画布按各输出格式分别转换模式、缩小并编码：
+缩小的版本直接从拼好的画布缩放，不重新解码、缩放原图；各格式的编码在线程池中同时进行
+（PIL编码时释放GIL）。附加格式的页面写到结果文件夹下以格式命名的子文件夹中
+"""
+
+from collections import namedtuple
+
+from PIL import Image
+from PIL.Image import Resampling
+
+from canvas_mode import reduce_mode
+
+# format: 输出格式；quality: 压缩质量；width: 缩小到的宽度，None为与画布相同
+Variant = namedtuple('Variant', 'format quality width', defaults=(None,))
+
+# 不支持透明通道的格式，透明画布按白底合成后再保存
+OPAQUE_FORMATS = ('jpg', 'jpeg', 'bmp')
+
+
+def parse_variant(spec, quality=None):
+    """
+    解析 格式[:质量[:宽度]] 形式的输出格式，如 png、jpg:85、webp:80:1080
+
+    参数:
+        quality: 没有写质量时使用的默认值
+    """
+    parts = spec.split(':')
+    if len(parts) > 3 or not parts[0]:
+        raise ValueError(f'无效的输出格式: {spec}')
+    format = parts[0].lower()
+    quality = int(parts[1]) if len(parts) > 1 and parts[1] else quality
+    width = int(parts[2]) if len(parts) > 2 and parts[2] else None
+    if width is not None and width <= 0:
+        raise ValueError(f'宽度必须为正整数: {spec}')
+    return Variant(format, quality, width)
+
+
+def variant_dir(variant):
+    # 子文件夹名：格式，缩小的版本再加上宽度，如 webp、jpg_1080
+    return variant.format if variant.width is None else f'{variant.format}_{variant.width}'
+
+
+def derive(canvas, variant, adaptive_mode=True, palette_rms=0):
+    """
+    从拼好的画布得到某种输出格式要保存的图片，不修改 canvas
+
+    参数:
+        canvas: 拼好的页面
+        variant: 输出格式
+        adaptive_mode: 为True时按该格式缩小画布模式，见 reduce_mode
+        palette_rms: 有损量化允许的误差，0为只做无损转换
+    """
+    image = canvas
+    if variant.width is not None and variant.width < canvas.size[0]:
+        height = max(1, round(canvas.size[1] * variant.width / canvas.size[0]))
+        image = canvas.resize((variant.width, height), Resampling.LANCZOS)
+    if variant.format in OPAQUE_FORMATS and image.mode in ('RGBA', 'LA'):
+        # 透明画布只出现在主格式支持透明时，这里按白底合成
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        background.alpha_composite(image.convert('RGBA'))
+        image = background.convert('RGB' if image.mode == 'RGBA' else 'L')
+    if adaptive_mode:
+        image = reduce_mode(image, variant.format, palette_rms)
+    if image is canvas:
+        # 主格式在另一个线程中保存 canvas，Image.save 会把编码参数写到图片对象上，
+        # 同一个对象不能同时保存，这里用副本
+        image = canvas.copy()
+    return image
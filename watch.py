@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+监视原图文件夹
+文件夹中的图片有增删改时，等一阵子没有新变化（防抖）后返回这一批变化，
+由调用方用常驻的进程池和缩放缓存重新生成受影响的输出。
+安装了 watchdog 时用 inotify 等系统通知唤醒，否则定时轮询
+"""
+
+import os
+import threading
+import time
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+def snapshot(paths):
+    # 用修改时间和大小判断文件是否变化，不读取内容
+    state = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        state[path] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def diff(old, new, since, detected):
+    """
+    比较两次快照，返回 {路径: 放入时间}
+
+    新增和改动的文件以修改时间作为放入时间；修改时间早于上一次快照（mv、cp -p
+    会保留原来的修改时间）或文件被删除时，以第一次发现变化的时间 detected 为准
+    """
+    changes = {}
+    for path, stat in new.items():
+        if old.get(path) != stat:
+            mtime = stat[0] / 1e9
+            changes[path] = mtime if since <= mtime <= detected else detected
+    changes.update((path, detected) for path in old.keys() - new.keys())
+    return changes
+
+
+if HAS_WATCHDOG:
+    class _WakeHandler(FileSystemEventHandler):
+        # 任何文件系统事件都只是唤醒等待的线程，具体变化由快照比较得出
+        def __init__(self, event):
+            super().__init__()
+            self.event = event
+
+        def on_any_event(self, event):
+            self.event.set()
+
+
+class FolderWatcher:
+    """
+    监视若干个原图文件夹
+
+    参数:
+        folders: 原图文件夹
+        list_files: 列出文件夹中图片的函数，与拼接时使用的规则一致
+        debounce: 连续这么多秒没有新变化才认为一批文件放完了
+        poll_interval: 轮询间隔（秒）；使用系统通知时作为检查是否被中断的超时
+        use_notify: 为False时即使安装了 watchdog 也只轮询
+    """
+
+    def __init__(self, folders, list_files, debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_notify=True):
+        self.folders = list(folders)
+        self.list_files = list_files
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._event = threading.Event()
+        self._observer = None
+        if use_notify and HAS_WATCHDOG:
+            self._observer = Observer()
+            handler = _WakeHandler(self._event)
+            for folder in self.folders:
+                self._observer.schedule(handler, str(folder), recursive=False)
+            self._observer.start()
+        self._last = self._snapshot()
+        self._last_time = time.time()
+
+    @property
+    def mode(self):
+        return 'inotify' if self._observer is not None else '轮询'
+
+    def _snapshot(self):
+        return {folder: snapshot(self.list_files(folder)) for folder in self.folders}
+
+    def _wait(self, timeout):
+        # 有系统通知时提前被唤醒；返回是否可能有变化
+        if self._observer is None:
+            time.sleep(timeout)
+            return True
+        woken = self._event.wait(timeout)
+        self._event.clear()
+        return woken
+
+    def changes(self):
+        """
+        阻塞到有一批变化并且已经防抖，返回 {文件夹: {路径: 放入时间}}，只包含有变化的文件夹
+        """
+        while True:
+            if not self._wait(self.poll_interval):
+                continue
+            detected = time.time()
+            current = self._snapshot()
+            if current == self._last:
+                continue
+            # 防抖：一次拷入很多文件时等全部放完再处理，只处理一次
+            while True:
+                time.sleep(self.debounce)
+                latest = self._snapshot()
+                if latest == current:
+                    break
+                current = latest
+            self._event.clear()
+            changed = {}
+            for folder in self.folders:
+                files = diff(self._last[folder], current[folder], self._last_time, detected)
+                if files:
+                    changed[folder] = files
+            self._last, self._last_time = current, time.time()
+            return changed
+
+    def close(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()